@@ -0,0 +1,387 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from hit_masks import rle_counts
+from round_index import source_signature
+
+# --------------------------
+# Compact annotation store
+# --------------------------
+# Columnar binary copy of a COCO instances file: a small JSON header followed by
+# aligned NumPy arrays that are memory-mapped read-only at load time.
+STORE_MAGIC = b'COCOSTR1'
+STORE_VERSION = 2
+ALIGNMENT = 64
+RAGGED_BATCH = 65536
+
+
+def _as_list(ids):
+    if ids is None:
+        return []
+    if isinstance(ids, (list, tuple, set, np.ndarray)):
+        return list(ids)
+    return [ids]
+
+
+def segmentation_columns(segmentation):
+    # Polygons become (ring lengths, flat coords); RLE becomes uncompressed counts.
+    if isinstance(segmentation, list):
+        rings = [ring for ring in segmentation if len(ring) >= 6]
+        coords = [v for ring in rings for v in ring]
+        return [len(ring) for ring in rings], coords, []
+    if isinstance(segmentation, dict) and 'counts' in segmentation:
+        return [], [], rle_counts(segmentation['counts'])
+    return [], [], []
+
+
+def ragged_column(rows, dtype):
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    flat = np.fromiter((v for row in rows for v in row), dtype=dtype, count=int(lengths.sum()))
+    return lengths, flat
+
+
+def _reorder_ragged(lengths, flat, order):
+    starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    new_lengths = lengths[order]
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=offsets[1:])
+    gather = np.repeat(starts[:-1][order] - offsets[:-1], new_lengths) + np.arange(offsets[-1])
+    return offsets, flat[gather]
+
+
+class ChunkedArray:
+    # A column handed to write_store as a sequence of pieces, for data too large
+    # to assemble in memory first. chunks() must yield exactly `shape` worth of
+    # `dtype` values, in order.
+    def __init__(self, dtype, shape, chunks):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.chunks = chunks
+
+
+def _reorder_ragged_chunked(lengths, flat, order, batch=RAGGED_BATCH):
+    # Same result as _reorder_ragged, gathered one batch of annotations at a time
+    # so a disk-backed `flat` (np.memmap) is never loaded whole.
+    starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    new_lengths = lengths[order]
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=offsets[1:])
+
+    def chunks():
+        for i in range(0, len(order), batch):
+            sel = order[i:i + batch]
+            local = offsets[i:i + len(sel) + 1] - offsets[i]
+            gather = np.repeat(starts[sel] - local[:-1], new_lengths[i:i + len(sel)]) + np.arange(local[-1])
+            yield flat[gather]
+    return offsets, ChunkedArray(flat.dtype, (int(offsets[-1]),), chunks)
+
+
+def category_index(ann_cat_ids, ann_img_ids, cat_ids):
+    ann_cat_pos = np.searchsorted(cat_ids, ann_cat_ids)
+    cat_ann_index = np.argsort(ann_cat_pos, kind='stable').astype(np.int64)
+    cat_ann_offsets = np.zeros(len(cat_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ann_cat_pos, minlength=len(cat_ids)), out=cat_ann_offsets[1:])
+    cat_img_chunks = []
+    cat_img_offsets = np.zeros(len(cat_ids) + 1, dtype=np.int64)
+    for k in range(len(cat_ids)):
+        chunk = np.unique(ann_img_ids[cat_ann_index[cat_ann_offsets[k]:cat_ann_offsets[k+1]]])
+        cat_img_chunks.append(chunk)
+        cat_img_offsets[k+1] = cat_img_offsets[k] + len(chunk)
+    cat_img_ids = np.concatenate(cat_img_chunks) if cat_img_chunks else np.zeros(0, dtype=np.int64)
+    return {
+        'cat_ids': cat_ids,
+        'cat_ann_offsets': cat_ann_offsets,
+        'cat_ann_index': cat_ann_index,
+        'cat_img_offsets': cat_img_offsets,
+        'cat_img_ids': cat_img_ids.astype(np.int64),
+    }
+
+
+def build_store_arrays(images, annotations, categories):
+    images = sorted(images, key=lambda img: img['id'])
+    img_ids = np.array([img['id'] for img in images], dtype=np.int64)
+    img_width = np.array([img.get('width', 0) for img in images], dtype=np.int32)
+    img_height = np.array([img.get('height', 0) for img in images], dtype=np.int32)
+    names = [img['file_name'].encode('utf-8') for img in images]
+    img_name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(n) for n in names], out=img_name_offsets[1:])
+    img_names = np.frombuffer(b''.join(names), dtype=np.uint8)
+
+    ann_ids = np.array([ann['id'] for ann in annotations], dtype=np.int64)
+    ann_img_ids = np.array([ann['image_id'] for ann in annotations], dtype=np.int64)
+    ann_cat_ids = np.array([ann['category_id'] for ann in annotations], dtype=np.int32)
+    ann_bboxes = np.array([ann['bbox'] for ann in annotations], dtype=np.float32).reshape(-1, 4)
+    ann_area = np.array([ann.get('area', 0) for ann in annotations], dtype=np.float32)
+    ann_iscrowd = np.array([ann.get('iscrowd', 0) for ann in annotations], dtype=np.uint8)
+    seg_columns = [segmentation_columns(ann.get('segmentation')) for ann in annotations]
+    ragged = {
+        'seg_ring_lengths': ragged_column([c[0] for c in seg_columns], np.int32),
+        'seg_coords': ragged_column([c[1] for c in seg_columns], np.float32),
+        'seg_rle_counts': ragged_column([c[2] for c in seg_columns], np.int32),
+    }
+    return assemble_store_arrays(img_ids, img_width, img_height, img_name_offsets, img_names,
+                                 ann_ids, ann_img_ids, ann_cat_ids, ann_bboxes, ann_area, ann_iscrowd,
+                                 categories, ragged)
+
+
+def assemble_store_arrays(img_ids, img_width, img_height, img_name_offsets, img_names,
+                          ann_ids, ann_img_ids, ann_cat_ids, ann_bboxes, ann_area, ann_iscrowd,
+                          categories, ragged=None, keep=None):
+    # `ragged` maps a column name to (per-annotation lengths, flat values); it is
+    # stored as <name>_offsets plus <name>, in the same annotation order as the rest.
+    # `keep` is an optional mask of annotations to store, so dropping rows never
+    # copies the ragged columns.
+    # Annotations are grouped by image (then id) so each image owns one contiguous slice.
+    order = np.lexsort((ann_ids, ann_img_ids))
+    if keep is not None:
+        order = order[keep[order]]
+    ann_ids = ann_ids[order]
+    ann_img_ids = ann_img_ids[order]
+    ann_cat_ids = ann_cat_ids[order]
+    ann_bboxes = ann_bboxes[order]
+    ann_area = ann_area[order]
+    ann_iscrowd = ann_iscrowd[order]
+    ann_img_pos = np.searchsorted(img_ids, ann_img_ids)
+    img_ann_offsets = np.zeros(len(img_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ann_img_pos, minlength=len(img_ids)), out=img_ann_offsets[1:])
+    ann_id_order = np.argsort(ann_ids, kind='stable').astype(np.int64)
+    ann_sorted_ids = ann_ids[ann_id_order]
+
+    cat_ids = np.array(sorted(cat['id'] for cat in categories), dtype=np.int32)
+
+    ragged_arrays = {}
+    for name, (lengths, flat) in (ragged or {}).items():
+        reorder = _reorder_ragged_chunked if isinstance(flat, np.memmap) else _reorder_ragged
+        ragged_arrays[f'{name}_offsets'], ragged_arrays[name] = reorder(lengths, flat, order)
+
+    return {
+        'img_ids': img_ids,
+        'img_width': img_width,
+        'img_height': img_height,
+        'img_name_offsets': img_name_offsets,
+        'img_names': img_names,
+        'img_ann_offsets': img_ann_offsets,
+        'ann_ids': ann_ids,
+        'ann_img_ids': ann_img_ids,
+        'ann_cat_ids': ann_cat_ids,
+        'ann_bboxes': ann_bboxes,
+        'ann_area': ann_area,
+        'ann_iscrowd': ann_iscrowd,
+        'ann_id_order': ann_id_order,
+        'ann_sorted_ids': ann_sorted_ids,
+        **category_index(ann_cat_ids, ann_img_ids, cat_ids),
+        **ragged_arrays,
+    }
+
+
+def write_store(store_path, arrays, categories, source=None):
+    header = {'version': STORE_VERSION, 'source': source,
+              'categories': sorted(categories, key=lambda cat: cat['id']), 'arrays': {}}
+    # Offsets are relative to the start of the data section, which begins at an
+    # aligned position right after the header.
+    offset = 0
+    for name, arr in arrays.items():
+        if not isinstance(arr, ChunkedArray):
+            arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        header['arrays'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset += -(-arr.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data_start = -(-(len(STORE_MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+    tmp_path = store_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(STORE_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + header['arrays'][name]['offset'])
+            if isinstance(arr, ChunkedArray):
+                written = 0
+                for chunk in arr.chunks():
+                    chunk = np.ascontiguousarray(chunk, dtype=arr.dtype)
+                    f.write(chunk.tobytes())
+                    written += chunk.nbytes
+                if written != arr.nbytes:
+                    raise ValueError(f"{name}: wrote {written} bytes, expected {arr.nbytes}")
+            else:
+                f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, store_path)
+
+
+def convert_annotations(annotation_file, store_path):
+    with open(annotation_file, 'r') as f:
+        dataset = json.load(f)
+    categories = dataset.get('categories', [])
+    arrays = build_store_arrays(dataset.get('images', []), dataset.get('annotations', []), categories)
+    del dataset
+    write_store(store_path, arrays, categories, source_signature(annotation_file))
+
+
+def read_store_header(store_path):
+    with open(store_path, 'rb') as f:
+        if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise ValueError(f"{store_path} is not an annotation store")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    header['data_start'] = -(-(len(STORE_MAGIC) + 8 + header_len) // ALIGNMENT) * ALIGNMENT
+    return header
+
+
+def open_annotation_store(annotation_file, store_path):
+    try:
+        header = read_store_header(store_path)
+        stale = header.get('version') != STORE_VERSION or header.get('source') != source_signature(annotation_file)
+    except (OSError, ValueError):
+        stale = True
+    if stale:
+        convert_annotations(annotation_file, store_path)
+    return AnnotationStore(store_path)
+
+
+class AnnotationStore:
+    # Drop-in replacement for the parts of pycocotools.coco.COCO the game uses.
+    def __init__(self, store_path):
+        self.store_path = store_path
+        header = read_store_header(store_path)
+        self.header = header
+        self._file = open(store_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data_start = header['data_start']
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            arr = np.frombuffer(self._mm, dtype=dtype, count=count, offset=data_start + spec['offset'])
+            setattr(self, name, arr.reshape(spec['shape']))
+        self.cats = {cat['id']: cat for cat in header['categories']}
+
+    def close(self):
+        for name in self.header['arrays']:
+            setattr(self, name, None)
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def _img_pos(self, img_ids):
+        img_ids = np.asarray(img_ids, dtype=np.int64)
+        if not len(self.img_ids):
+            return np.zeros(0, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.img_ids, img_ids), len(self.img_ids) - 1)
+        return pos[self.img_ids[pos] == img_ids]
+
+    def _cat_pos(self, cat_id):
+        pos = int(np.searchsorted(self.cat_ids, cat_id))
+        if pos < len(self.cat_ids) and self.cat_ids[pos] == cat_id:
+            return pos
+        return None
+
+    def _ann_pos(self, ann_ids):
+        ann_ids = np.asarray(ann_ids, dtype=np.int64)
+        if not len(self.ann_sorted_ids):
+            return np.zeros(0, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ann_sorted_ids, ann_ids), len(self.ann_sorted_ids) - 1)
+        return self.ann_id_order[pos[self.ann_sorted_ids[pos] == ann_ids]]
+
+    def getCatIds(self, catNms=[], supNms=[], catIds=[]):
+        catNms, supNms, catIds = _as_list(catNms), _as_list(supNms), _as_list(catIds)
+        cats = list(self.cats.values())
+        if catNms:
+            cats = [cat for cat in cats if cat['name'] in catNms]
+        if supNms:
+            cats = [cat for cat in cats if cat.get('supercategory') in supNms]
+        if catIds:
+            cats = [cat for cat in cats if cat['id'] in catIds]
+        return [cat['id'] for cat in cats]
+
+    def getImgIds(self, imgIds=[], catIds=[]):
+        imgIds, catIds = _as_list(imgIds), _as_list(catIds)
+        if not imgIds and not catIds:
+            return self.img_ids.tolist()
+        ids = set(imgIds)
+        for i, cat_id in enumerate(catIds):
+            k = self._cat_pos(cat_id)
+            cat_imgs = self.cat_img_ids[self.cat_img_offsets[k]:self.cat_img_offsets[k+1]] if k is not None else []
+            if i == 0 and not ids:
+                ids = set(int(v) for v in cat_imgs)
+            else:
+                ids &= set(int(v) for v in cat_imgs)
+        return list(ids)
+
+    def getAnnIds(self, imgIds=[], catIds=[], areaRng=[], iscrowd=None):
+        imgIds, catIds, areaRng = _as_list(imgIds), _as_list(catIds), _as_list(areaRng)
+        if imgIds:
+            pos = self._img_pos(imgIds)
+            starts, ends = self.img_ann_offsets[pos], self.img_ann_offsets[pos + 1]
+            idx = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(pos) else np.zeros(0, dtype=np.int64)
+        else:
+            idx = np.arange(len(self.ann_ids))
+        if catIds:
+            idx = idx[np.isin(self.ann_cat_ids[idx], catIds)]
+        if areaRng:
+            area = self.ann_area[idx]
+            idx = idx[(area > areaRng[0]) & (area < areaRng[1])]
+        if iscrowd is not None:
+            idx = idx[self.ann_iscrowd[idx] == int(iscrowd)]
+        return self.ann_ids[idx].tolist()
+
+    def loadCats(self, ids=[]):
+        return [self.cats[cat_id] for cat_id in _as_list(ids)]
+
+    def loadImgs(self, ids=[]):
+        imgs = []
+        for pos in self._img_pos(_as_list(ids)):
+            start, end = self.img_name_offsets[pos], self.img_name_offsets[pos + 1]
+            imgs.append({
+                'id': int(self.img_ids[pos]),
+                'file_name': self.img_names[start:end].tobytes().decode('utf-8'),
+                'width': int(self.img_width[pos]),
+                'height': int(self.img_height[pos]),
+            })
+        return imgs
+
+    def _segmentation(self, pos):
+        if not hasattr(self, 'seg_ring_lengths'):
+            return []
+        start, end = self.seg_rle_counts_offsets[pos], self.seg_rle_counts_offsets[pos + 1]
+        if end > start:
+            img_pos = self._img_pos([self.ann_img_ids[pos]])
+            size = [int(self.img_height[img_pos[0]]), int(self.img_width[img_pos[0]])] if len(img_pos) else [0, 0]
+            return {'counts': self.seg_rle_counts[start:end].tolist(), 'size': size}
+        rings = []
+        coord = self.seg_coords_offsets[pos]
+        start, end = self.seg_ring_lengths_offsets[pos], self.seg_ring_lengths_offsets[pos + 1]
+        for length in self.seg_ring_lengths[start:end]:
+            rings.append(self.seg_coords[coord:coord + length].tolist())
+            coord += length
+        return rings
+
+    def loadAnns(self, ids=[]):
+        anns = []
+        for pos in self._ann_pos(_as_list(ids)):
+            anns.append({
+                'id': int(self.ann_ids[pos]),
+                'image_id': int(self.ann_img_ids[pos]),
+                'category_id': int(self.ann_cat_ids[pos]),
+                'bbox': [float(v) for v in self.ann_bboxes[pos]],
+                'area': float(self.ann_area[pos]),
+                'iscrowd': int(self.ann_iscrowd[pos]),
+                'segmentation': self._segmentation(pos),
+            })
+        return anns
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a COCO instances JSON file into a memory-mapped annotation store.")
+    parser.add_argument('annotation_file')
+    parser.add_argument('store_path')
+    args = parser.parse_args()
+    convert_annotations(args.annotation_file, args.store_path)
@@ -0,0 +1,214 @@
+import collections
+import hashlib
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------
+# TTS engines
+# --------------------------
+# Engines are tried in order. gTTS needs the network; the others run locally
+# and are used when gTTS fails or is not installed.
+class GTTSEngine:
+    name = 'gtts'
+    extension = 'mp3'
+
+    def available(self):
+        return importlib.util.find_spec('gtts') is not None
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buf)
+        return buf.getvalue()
+
+
+class EspeakEngine:
+    name = 'espeak'
+    extension = 'wav'
+
+    def __init__(self):
+        self.binary = shutil.which('espeak-ng') or shutil.which('espeak')
+
+    def available(self):
+        return self.binary is not None
+
+    def synthesize(self, text, lang):
+        result = subprocess.run([self.binary, '-v', lang, '--stdout', text], capture_output=True, check=True)
+        return result.stdout
+
+
+class Pyttsx3Engine:
+    name = 'pyttsx3'
+    extension = 'wav'
+
+    def __init__(self):
+        # pyttsx3 drivers are not thread-safe.
+        self.lock = threading.Lock()
+
+    def available(self):
+        # Only probed: importing pyttsx3 loads its driver stack.
+        return importlib.util.find_spec('pyttsx3') is not None
+
+    def synthesize(self, text, lang):
+        import pyttsx3
+        with self.lock:
+            fd, path = tempfile.mkstemp(suffix='.wav')
+            os.close(fd)
+            try:
+                engine = pyttsx3.init()
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+                with open(path, 'rb') as f:
+                    return f.read()
+            finally:
+                os.remove(path)
+
+
+ENGINES = {
+    'gtts': GTTSEngine,
+    'espeak': EspeakEngine,
+    'pyttsx3': Pyttsx3Engine,
+}
+
+
+def register_engine(engine_class):
+    ENGINES[engine_class.name] = engine_class
+
+
+def make_engines(names):
+    engines = []
+    for name in names:
+        engine = ENGINES[name]()
+        if engine.available():
+            engines.append(engine)
+    return engines
+
+
+# --------------------------
+# Audio cache
+# --------------------------
+# Clips are content-addressed by sha256(engine, language, text). A lookup checks
+# every configured engine's key before synthesizing, so once the cache is warm
+# no engine (and no network) is touched.
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+def audio_key(text, lang, engine_name):
+    return hashlib.sha256(f"{engine_name}\0{lang}\0{text}".encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    def __init__(self, cache_dir, engines, max_bytes=DEFAULT_MAX_BYTES, lang='en'):
+        self.cache_dir = cache_dir
+        self.engines = engines
+        self.max_bytes = max_bytes
+        self.lang = lang
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def _name(self, text, engine):
+        return f"{audio_key(text, self.lang, engine.name)}.{engine.extension}"
+
+    def lookup(self, text):
+        for engine in self.engines:
+            name = self._name(text, engine)
+            with self.lock:
+                if name not in self.entries:
+                    continue
+                self.entries.move_to_end(name)
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                with self.lock:
+                    self.total_bytes -= self.entries.pop(name, 0)
+                continue
+            with self.lock:
+                self.hits += 1
+            return data
+        return None
+
+    def get(self, text):
+        data = self.lookup(text)
+        if data is not None:
+            return data
+        with self.lock:
+            self.misses += 1
+        for engine in self.engines:
+            try:
+                data = engine.synthesize(text, self.lang)
+            except Exception:
+                continue
+            if data:
+                self._store(self._name(text, engine), data)
+                return data
+        with self.lock:
+            self.failures += 1
+        return None
+
+    def prewarm(self, texts, workers=4, progress_callback=None):
+        texts = list(dict.fromkeys(texts))
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(self.get, texts):
+                done += 1
+                if progress_callback:
+                    progress_callback(done, len(texts))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
+
+    def _store(self, name, data):
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        evicted = []
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_name, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name))
+            except OSError:
+                pass
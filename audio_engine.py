@@ -0,0 +1,169 @@
+import collections
+import io
+import threading
+import time
+from latency import record, span
+
+# --------------------------
+# Audio engine
+# --------------------------
+# One thread owns playback. Callers enqueue clips with a policy:
+#   PREEMPT - drop everything pending and cut off the clip that is playing
+#   QUEUE   - play after the current clip, unless it is older than max_age by then
+# A clip that is already pending is not queued twice.
+PREEMPT = 'preempt'
+QUEUE = 'queue'
+DEFAULT_MAX_AGE = 2.0
+LATENCY_SAMPLES = 256
+
+
+class AudioRequest:
+    def __init__(self, key, data, policy, max_age, generation):
+        self.key = key
+        self.data = data
+        self.policy = policy
+        self.max_age = max_age
+        self.generation = generation
+        self.enqueued = time.perf_counter()
+
+
+class AudioEngine:
+    def __init__(self, resolve, max_sounds=64):
+        # resolve(key) -> encoded clip bytes, called on the engine thread.
+        self.resolve = resolve
+        self.max_sounds = max_sounds
+        self.sounds = collections.OrderedDict()
+        self.sounds_lock = threading.Lock()
+        self.pending = collections.deque()
+        self.cond = threading.Condition()
+        self.generation = 0
+        self.current = None
+        self.running = False
+        self.played = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.dropped += len(self.pending)
+            self.pending.clear()
+            self.cond.notify_all()
+        self._stop_current()
+
+    def play(self, key, data=None, policy=PREEMPT, max_age=DEFAULT_MAX_AGE):
+        with self.cond:
+            if policy == PREEMPT:
+                self.generation += 1
+                self.dropped += len(self.pending)
+                self.pending.clear()
+            elif any(req.key == key for req in self.pending):
+                self.coalesced += 1
+                return
+            self.pending.append(AudioRequest(key, data, policy, max_age, self.generation))
+            self.cond.notify_all()
+
+    def preload(self, keys):
+        for key in keys:
+            try:
+                self._sound(key, None)
+            except Exception:
+                pass
+
+    def queue_depth(self):
+        with self.cond:
+            return len(self.pending)
+
+    def stats(self):
+        with self.cond:
+            latencies = sorted(self.latencies)
+            depth = len(self.pending)
+        return {
+            'queue_depth': depth,
+            'played': self.played,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'cached_sounds': len(self.sounds),
+            'latency_p50_ms': 1000 * latencies[len(latencies) // 2] if latencies else 0.0,
+            'latency_max_ms': 1000 * latencies[-1] if latencies else 0.0,
+        }
+
+    def _sound(self, key, data):
+        import pygame
+        with self.sounds_lock:
+            sound = self.sounds.get(key)
+            if sound is not None:
+                self.sounds.move_to_end(key)
+                return sound
+        if data is None:
+            with span('audio.resolve'):
+                data = self.resolve(key)
+        if not data:
+            return None
+        with span('audio.decode'):
+            sound = pygame.mixer.Sound(file=io.BytesIO(data))
+        with self.sounds_lock:
+            self.sounds[key] = sound
+            while len(self.sounds) > self.max_sounds:
+                self.sounds.popitem(last=False)
+        return sound
+
+    def _busy(self):
+        return self.current is not None and self.current.get_busy()
+
+    def _stop_current(self):
+        current, self.current = self.current, None
+        if current is not None:
+            try:
+                current.stop()
+            except Exception:
+                pass
+
+    def _wait_until_idle(self, req):
+        while self._busy():
+            with self.cond:
+                if not self.running or req.generation != self.generation:
+                    return False
+                self.cond.wait(0.02)
+        return True
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                req = self.pending.popleft()
+            try:
+                sound = self._sound(req.key, req.data)
+            except Exception:
+                sound = None
+            if sound is None:
+                continue
+            idle = req.policy != QUEUE or self._wait_until_idle(req)
+            with self.cond:
+                stale = not idle or req.generation != self.generation
+                if req.policy == QUEUE and time.perf_counter() - req.enqueued > req.max_age:
+                    stale = True
+                if stale:
+                    self.dropped += 1
+            if stale:
+                continue
+            self._stop_current()
+            try:
+                self.current = sound.play()
+            except Exception:
+                continue
+            latency = time.perf_counter() - req.enqueued
+            record('audio.queue_to_play', latency)
+            with self.cond:
+                self.played += 1
+                self.latencies.append(latency)
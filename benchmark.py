@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from PIL import Image
+from annotation_store import open_annotation_store
+from game_engine import COMPLETE, IGNORED, GameEngine, RoundFactory
+from image_source import DirectoryImageSource
+from latency import timings
+from prefetch import RoundPrefetcher
+from round_index import load_round_index
+from round_pack import RoundPack
+from thumbnail_cache import ThumbnailCache
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# --------------------------
+# Headless benchmark
+# --------------------------
+# Drives GameEngine with no display against a small synthetic COCO-format
+# fixture (or a real dataset). Clicks are synthetic (seeded) or replayed from a
+# session recorded with --record.
+FIXTURE_CATEGORIES = ['cat', 'dog', 'person', 'car', 'bus', 'chair']
+FIXTURE_SIZES = [(640, 480), (500, 375), (480, 640)]
+MIN_BBOX_SIZE = 80
+MIN_MULTI_INSTANCE_SIZE = 80
+MAX_SMALL_INSTANCES = 3
+
+
+def make_fixture(fixture_dir, num_images=200, seed=0):
+    rng = random.Random(seed)
+    images_dir = os.path.join(fixture_dir, 'images')
+    annotation_file = os.path.join(fixture_dir, 'instances.json')
+    os.makedirs(images_dir, exist_ok=True)
+    categories = [{'id': i + 1, 'name': name, 'supercategory': 'thing'} for i, name in enumerate(FIXTURE_CATEGORIES)]
+    images = []
+    annotations = []
+    for img_id in range(1, num_images + 1):
+        width, height = rng.choice(FIXTURE_SIZES)
+        file_name = f"{img_id:012d}.jpg"
+        path = os.path.join(images_dir, file_name)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if not os.path.exists(path):
+            Image.new('RGB', (width, height), color).save(path, quality=85)
+        images.append({'id': img_id, 'file_name': file_name, 'width': width, 'height': height})
+        cat_id = rng.choice(categories)['id']
+        for _ in range(rng.randint(1, 3)):
+            w = rng.randint(90, width // 2)
+            h = rng.randint(90, height // 2)
+            x = rng.randint(0, width - w)
+            y = rng.randint(0, height - h)
+            # A diamond, so mask and bbox hit-testing disagree near the corners.
+            polygon = [x + w / 2, y, x + w, y + h / 2, x + w / 2, y + h, x, y + h / 2]
+            annotations.append({
+                'id': len(annotations) + 1, 'image_id': img_id, 'category_id': cat_id,
+                'bbox': [x, y, w, h], 'area': w * h / 2, 'iscrowd': 0, 'segmentation': [polygon],
+            })
+    with open(annotation_file, 'w') as f:
+        json.dump({'images': images, 'annotations': annotations, 'categories': categories}, f)
+    return annotation_file, images_dir
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return rss / (1024 * 1024) if os.uname().sysname == 'Darwin' else rss / 1024
+
+
+def synthetic_clicks(rng, engine, miss_rate):
+    # Yields display-space clicks until the round is complete: a miss now and
+    # then, otherwise the centre of an instance that has not been found yet.
+    width, height = engine.factory.display_size
+    scale_x, scale_y = engine.round['scale']
+    for _ in range(4 * engine.total_instances + 8):
+        if rng.random() < miss_rate:
+            yield rng.randrange(width), rng.randrange(height)
+            continue
+        remaining = [i for i in range(engine.total_instances) if i not in engine.instances_found]
+        if not remaining:
+            return
+        x1, y1, x2, y2 = engine.round['bboxes'][rng.choice(remaining)]
+        yield int((x1 + x2) / 2 * scale_x), int((y1 + y2) / 2 * scale_y)
+
+
+def run_benchmark(engine, rounds, seed=0, miss_rate=0.2, replay=None):
+    rng = random.Random(seed)
+    round_times = []
+    click_times = []
+    session = []
+    completed = 0
+    started = time.perf_counter()
+    for n in range(rounds):
+        t0 = time.perf_counter()
+        info = engine.next_round()
+        round_times.append(time.perf_counter() - t0)
+        if 'error' in info:
+            continue
+        clicks = replay[n % len(replay)]['clicks'] if replay else synthetic_clicks(rng, engine, miss_rate)
+        recorded = []
+        for x, y in clicks:
+            t0 = time.perf_counter()
+            feedback = engine.submit_click(x, y)
+            click_times.append(time.perf_counter() - t0)
+            if feedback['result'] == IGNORED:
+                continue
+            recorded.append((x, y))
+            if feedback['result'] == COMPLETE:
+                completed += 1
+                break
+        else:
+            engine.reveal_answers()
+        session.append({'category': info['category'], 'clicks': recorded})
+    elapsed = time.perf_counter() - started
+    return {
+        'rounds': rounds,
+        'completed': completed,
+        'elapsed_s': elapsed,
+        'rounds_per_s': rounds / elapsed if elapsed else 0.0,
+        'round_p50_ms': 1000 * percentile(round_times, 50),
+        'round_p99_ms': 1000 * percentile(round_times, 99),
+        'click_p50_us': 1e6 * percentile(click_times, 50),
+        'click_p99_us': 1e6 * percentile(click_times, 99),
+        'score': engine.stats()['score'],
+    }, session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay click sessions against the headless game engine.")
+    parser.add_argument('--annotations', help="COCO instances JSON (default: generate a synthetic fixture)")
+    parser.add_argument('--images', help="Image directory for --annotations")
+    parser.add_argument('--pack', help="Play rounds from a round_pack.py file instead of the dataset")
+    parser.add_argument('--fixture-dir', help="Where to build the synthetic fixture (default: a temp dir)")
+    parser.add_argument('--fixture-images', type=int, default=200)
+    parser.add_argument('--level', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--miss-rate', type=float, default=0.2)
+    parser.add_argument('--hit-test', choices=['mask', 'bbox'], default='mask')
+    parser.add_argument('--thumbnails', action='store_true', help="Serve images through a ThumbnailCache")
+    parser.add_argument('--prefetch', type=int, default=0, help="Prefetch depth (0 disables the prefetcher)")
+    parser.add_argument('--record', help="Write the clicks that were played to this JSON file")
+    parser.add_argument('--replay', help="Replay clicks from a file written by --record")
+    parser.add_argument('--no-timings', action='store_true', help="Disable per-stage latency spans")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+    timings.enabled = not args.no_timings
+
+    work_dir = args.fixture_dir or tempfile.mkdtemp(prefix='find_items_bench_')
+    if args.pack:
+        annotation_file = images_dir = None
+    elif args.annotations:
+        annotation_file, images_dir = args.annotations, args.images
+    else:
+        annotation_file, images_dir = make_fixture(work_dir, args.fixture_images, args.seed)
+    # RoundIndex picks with the module-level RNG; seeding it makes --record/--replay line up.
+    random.seed(args.seed)
+    replay = None
+    if args.replay:
+        with open(args.replay) as f:
+            replay = json.load(f)
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    if args.pack:
+        factory = round_index = RoundPack(args.pack)
+    else:
+        coco = open_annotation_store(annotation_file, os.path.join(work_dir, 'instances.store'))
+        round_index = load_round_index(
+            coco, annotation_file, os.path.join(work_dir, 'round_index.json'),
+            args.level, MIN_BBOX_SIZE, MIN_MULTI_INSTANCE_SIZE, MAX_SMALL_INSTANCES
+        )
+        thumbnail_cache = ThumbnailCache(os.path.join(work_dir, 'thumbnails')) if args.thumbnails else None
+        factory = RoundFactory(coco, round_index, DirectoryImageSource(images_dir), thumbnail_cache,
+                               hit_test_mode=args.hit_test)
+    setup_s = time.perf_counter() - t0
+    prefetcher = None
+    if args.prefetch:
+        prefetcher = RoundPrefetcher(factory.prepare, factory.random_category, depth=args.prefetch).start()
+    engine = GameEngine(factory, args.level, prefetcher, click_debounce_ms=0)
+    try:
+        report, session = run_benchmark(engine, args.rounds, args.seed, args.miss_rate, replay)
+    finally:
+        if prefetcher is not None:
+            prefetcher.cancel()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report.update({
+        'setup_s': setup_s,
+        'round_index_size': len(round_index),
+        'peak_traced_mb': peak / (1024 * 1024),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timings.snapshot(),
+    })
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(session, f)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"rounds:            {report['rounds']} ({report['completed']} completed)")
+    print(f"rounds/sec:        {report['rounds_per_s']:.1f}")
+    print(f"round prep p50/99: {report['round_p50_ms']:.2f} / {report['round_p99_ms']:.2f} ms")
+    print(f"click p50/99:      {report['click_p50_us']:.1f} / {report['click_p99_us']:.1f} us")
+    print(f"setup:             {report['setup_s']:.2f} s ({report['round_index_size']} images)")
+    print(f"peak memory:       {report['peak_traced_mb']:.1f} MB traced", end='')
+    if report['peak_rss_mb'] is not None:
+        print(f", {report['peak_rss_mb']:.1f} MB RSS")
+    else:
+        print()
+    for name, summary in report['stages'].items():
+        print(f"  {name:<22} p50 {summary['p50_ms']:8.3f} ms  p95 {summary['p95_ms']:8.3f} ms  n={summary['count']}")
+
+
+if __name__ == '__main__':
+    main()
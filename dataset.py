@@ -0,0 +1,186 @@
+import os
+import zipfile
+from image_source import MultiImageSource, make_image_source
+from round_index import RoundIndex, load_round_index, thresholds_key
+
+# --------------------------
+# COCO Dataset Configuration
+# --------------------------
+# Where the dataset and its caches live, and how they are fetched and loaded.
+# Shared by the Tk game (find_items.py) and the headless tools (server.py,
+# lab.py, round_pack.py, verify.py), none of which should need Tk to start.
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coco_dataset')
+COCO_ANNOTATION_FILE = os.path.join(DATASET_DIR, 'annotations/instances_val2017.json')
+COCO_IMAGES_DIR = os.path.join(DATASET_DIR, 'val2017/')
+COCO_IMAGES_ZIP = os.path.join(DATASET_DIR, 'val2017.zip')
+COCO_STORE_FILE = os.path.join(DATASET_DIR, 'annotations/instances_val2017.store')
+ROUND_INDEX_FILE = os.path.join(DATASET_DIR, 'round_index.json')
+THUMBNAIL_CACHE_DIR = os.path.join(DATASET_DIR, 'thumbnails')
+THUMBNAIL_CACHE_MAX_BYTES = 200 * 1024 * 1024
+AUDIO_CACHE_DIR = os.path.join(DATASET_DIR, 'audio_cache')
+AUDIO_CACHE_MAX_BYTES = 100 * 1024 * 1024
+AUDIO_ENGINES = ('gtts', 'espeak', 'pyttsx3')
+AUDIO_LANG = 'en'
+
+COCO_ANNOTATIONS_URL = 'http://images.cocodataset.org/annotations/annotations_trainval2017.zip'
+COCO_VAL_IMAGES_URL = 'http://images.cocodataset.org/zips/val2017.zip'
+DATASET_CHECKSUMS = {
+    COCO_ANNOTATIONS_URL: '8551ee4bb5860311e79dace7e79cb91e432e78b3',
+    COCO_VAL_IMAGES_URL: '4950dc9d00dbe1c933ee0170f5797584351d2a41',
+}
+
+MIN_BBOX_SIZE = 80
+MIN_MULTI_INSTANCE_SIZE = 80
+MAX_SMALL_INSTANCES = 3
+
+# Set FIND_ITEMS_SOURCES to a JSON list of instance files to merge with
+# ingest.py (train2017, LVIS, custom sets) and play from instead of val2017.
+SOURCES_FILE = os.environ.get('FIND_ITEMS_SOURCES')
+CORPUS_DIR = os.path.join(DATASET_DIR, 'corpus')
+CORPUS_ROUND_INDEX_FILE = os.path.join(CORPUS_DIR, 'round_index.json')
+CORPUS_THUMBNAIL_CACHE_DIR = os.path.join(CORPUS_DIR, 'thumbnails')
+# Images are decoded once in the background and the results kept in a manifest
+# (see verify.py); images that fail are left out of every level.
+IMAGE_MANIFEST_FILE = os.path.join(DATASET_DIR, 'image_manifest.json')
+CORPUS_IMAGE_MANIFEST_FILE = os.path.join(CORPUS_DIR, 'image_manifest.json')
+VERIFY_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+coco = None
+image_source = None
+quarantine = set()
+image_verifier = None
+_round_indexes = {}
+
+
+def download_file(url, target_path, progress_callback=None):
+    from downloader import download
+    download(url, target_path, expected_sha1=DATASET_CHECKSUMS.get(url), progress_callback=progress_callback)
+
+
+def extract_zip(zip_path, extract_dir):
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extractall(extract_dir)
+
+
+def images_available():
+    return os.path.exists(COCO_IMAGES_DIR) or os.path.exists(COCO_IMAGES_ZIP)
+
+
+def ensure_dataset_available(progress_callback=None):
+    # A merged corpus brings its own files; nothing is downloaded for it.
+    if SOURCES_FILE or (os.path.exists(COCO_ANNOTATION_FILE) and images_available()):
+        return True
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    def fetch(url, target_path):
+        name = os.path.basename(target_path)
+        callback = None
+        if progress_callback:
+            callback = lambda done, total, rate: progress_callback(name, done, total, rate)
+        download_file(url, target_path, callback)
+    annotations_zip = os.path.join(DATASET_DIR, 'annotations.zip')
+    try:
+        if not os.path.exists(COCO_ANNOTATION_FILE):
+            fetch(COCO_ANNOTATIONS_URL, annotations_zip)
+            extract_zip(annotations_zip, DATASET_DIR)
+        # Images are read straight from val2017.zip, so it is only checked, not extracted.
+        if not os.path.exists(COCO_IMAGES_DIR):
+            fetch(COCO_VAL_IMAGES_URL, COCO_IMAGES_ZIP)
+            try:
+                zipfile.ZipFile(COCO_IMAGES_ZIP, 'r').close()
+            except zipfile.BadZipFile:
+                os.remove(COCO_IMAGES_ZIP)
+                fetch(COCO_VAL_IMAGES_URL, COCO_IMAGES_ZIP)
+        return True
+    except:
+        return False
+
+
+def load_annotations(progress_callback=None):
+    if SOURCES_FILE:
+        try:
+            from annotation_store import AnnotationStore
+            from ingest import ingest_corpus, load_sources
+            store_path, _ = ingest_corpus(load_sources(SOURCES_FILE), CORPUS_DIR, progress_callback)
+            return AnnotationStore(store_path)
+        except:
+            return None
+    try:
+        from annotation_store import open_annotation_store
+        return open_annotation_store(COCO_ANNOTATION_FILE, COCO_STORE_FILE)
+    except:
+        pass
+    try:
+        from pycocotools.coco import COCO
+        return COCO(COCO_ANNOTATION_FILE)
+    except:
+        return None
+
+
+def open_image_source():
+    if not SOURCES_FILE:
+        return make_image_source(COCO_IMAGES_DIR, COCO_IMAGES_ZIP)
+    from ingest import load_sources
+    sources = {}
+    def make(entry):
+        return make_image_source(entry.get('images') or '', entry.get('zip') or '')
+    try:
+        for source in load_sources(SOURCES_FILE):
+            if source.get('splits'):
+                # File names are "<split>/<file name>" (see ingest.image_file_name).
+                splits = {name: make(entry) for name, entry in source['splits'].items()}
+                images = MultiImageSource({name: split for name, split in splits.items() if split is not None})
+            else:
+                images = make(source)
+            if images is not None:
+                sources[source['name']] = images
+    except (OSError, ValueError):
+        pass
+    return MultiImageSource(sources)
+
+
+def round_index_files():
+    # A merged corpus is signed by its store, which ingest.py rewrites on change.
+    if SOURCES_FILE:
+        return coco.store_path, CORPUS_ROUND_INDEX_FILE
+    return COCO_ANNOTATION_FILE, ROUND_INDEX_FILE
+
+
+def get_round_index(max_instances, min_bbox_size, min_multi_instance_size, max_small_instances):
+    key = thresholds_key(max_instances, min_bbox_size, min_multi_instance_size, max_small_instances)
+    if key not in _round_indexes:
+        if coco is None:
+            return RoundIndex({})
+        annotation_file, index_file = round_index_files()
+        round_index = load_round_index(
+            coco, annotation_file, index_file,
+            max_instances, min_bbox_size, min_multi_instance_size, max_small_instances
+        )
+        round_index.exclude(quarantine)
+        _round_indexes[key] = round_index
+    return _round_indexes[key]
+
+
+def image_manifest_file():
+    return CORPUS_IMAGE_MANIFEST_FILE if SOURCES_FILE else IMAGE_MANIFEST_FILE
+
+
+def thumbnail_cache_dir():
+    return CORPUS_THUMBNAIL_CACHE_DIR if SOURCES_FILE else THUMBNAIL_CACHE_DIR
+
+
+def load_quarantine():
+    from verify import load_manifest, quarantined
+    quarantine.update(quarantined(load_manifest(image_manifest_file())))
+
+
+def quarantine_image(file_name):
+    quarantine.add(file_name)
+    for round_index in list(_round_indexes.values()):
+        round_index.exclude([file_name])
+
+
+def start_image_verifier():
+    global image_verifier
+    from verify import BackgroundVerifier
+    image_verifier = BackgroundVerifier(image_manifest_file(), open_image_source, VERIFY_WORKERS,
+                                        quarantine_image).start()
@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------
+# Parallel resumable downloader
+# --------------------------
+# Files are fetched as fixed-size byte ranges on a pooled session. Finished
+# ranges are recorded in a sidecar state file next to the partial download so
+# an interrupted download picks up where it stopped.
+DEFAULT_WORKERS = 4
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadProgress:
+    def __init__(self, total, done=0, callback=None):
+        self.total = total
+        self.done = done
+        self.resumed = done
+        self.callback = callback
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def bytes_per_second(self):
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.resumed) / elapsed if elapsed > 0 else 0.0
+
+    def add(self, nbytes):
+        with self.lock:
+            self.done += nbytes
+            done = self.done
+        if self.callback:
+            self.callback(done, self.total, self.bytes_per_second)
+
+
+def make_session(workers=DEFAULT_WORKERS):
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def file_hash(path, algorithm='sha1'):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_file(path, expected_size=None, expected_sha1=None):
+    if not os.path.exists(path):
+        return False
+    if expected_size is not None and os.path.getsize(path) != expected_size:
+        return False
+    if expected_sha1 is not None and file_hash(path, 'sha1') != expected_sha1.lower():
+        return False
+    return True
+
+
+def _probe(session, url):
+    response = session.head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    size = response.headers.get('Content-Length')
+    accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    return (int(size) if size is not None else None), accepts_ranges
+
+
+def _load_state(state_path, url, size, segment_size):
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('url') != url or state.get('size') != size or state.get('segment_size') != segment_size:
+        return None
+    return state
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def _fetch_segment(session, url, part_path, start, end, progress):
+    headers = {'Range': f'bytes={start}-{end}'}
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 200:
+            raise DownloadError(f"Server ignored range request for {url}")
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise DownloadError(f"Unexpected status {response.status_code} for bytes {start}-{end} of {url}")
+        written = 0
+        with open(part_path, 'r+b') as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+                    progress.add(len(chunk))
+        if written != end - start + 1:
+            raise DownloadError(f"Short read for bytes {start}-{end} of {url}")
+
+
+def _download_ranges(session, url, part_path, state_path, size, segment_size, workers, progress_callback):
+    state = _load_state(state_path, url, size, segment_size)
+    if state is None or not os.path.exists(part_path):
+        state = {'url': url, 'size': size, 'segment_size': segment_size, 'done': []}
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        _save_state(state_path, state)
+    segments = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+    done = set(state['done'])
+    pending = [i for i in range(len(segments)) if i not in done]
+    progress = DownloadProgress(size, sum(segments[i][1] - segments[i][0] + 1 for i in done), progress_callback)
+    state_lock = threading.Lock()
+
+    def run(i):
+        start, end = segments[i]
+        _fetch_segment(session, url, part_path, start, end, progress)
+        with state_lock:
+            done.add(i)
+            state['done'] = sorted(done)
+            _save_state(state_path, state)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(run, i) for i in pending]:
+            future.result()
+
+
+def _download_stream(session, url, part_path, size, progress_callback):
+    progress = DownloadProgress(size, 0, progress_callback)
+    with session.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    progress.add(len(chunk))
+
+
+def download(url, target_path, expected_size=None, expected_sha1=None, workers=DEFAULT_WORKERS,
+             segment_size=DEFAULT_SEGMENT_SIZE, progress_callback=None, session=None):
+    if verify_file(target_path, expected_size, expected_sha1):
+        return target_path
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    part_path = target_path + '.part'
+    state_path = target_path + '.part.json'
+    own_session = session is None
+    if own_session:
+        session = make_session(workers)
+    try:
+        size, accepts_ranges = _probe(session, url)
+        if expected_size is not None and size is not None and size != expected_size:
+            raise DownloadError(f"{url} reports {size} bytes, expected {expected_size}")
+        if size and accepts_ranges:
+            _download_ranges(session, url, part_path, state_path, size, segment_size, workers, progress_callback)
+        else:
+            _download_stream(session, url, part_path, size, progress_callback)
+    finally:
+        if own_session:
+            session.close()
+    if not verify_file(part_path, expected_size if expected_size is not None else size, expected_sha1):
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise DownloadError(f"Downloaded file for {url} failed verification")
+    os.replace(part_path, target_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return target_path
+
+
+# --------------------------
+# Self-test against a local Range server
+# --------------------------
+class _RangeServer:
+    # Serves `data` on 127.0.0.1 with HEAD and Range support. Every GET is
+    # logged; the first `fail_segments` range requests starting at or past
+    # `fail_from` get a 500, and `mode` can make it ignore ranges ('full') or
+    # answer 404 ('missing').
+    def __init__(self, data):
+        import http.server
+        self.data = data
+        self.requests = []
+        self.fail_from = 0
+        self.fail_segments = 0
+        self.mode = 'ranges'
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(server.data)))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+
+            def do_GET(self):
+                status, body, extra = server.respond(self.headers.get('Range'))
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # The client hangs up as soon as it sees a status it rejects.
+                    pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/dataset.zip"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def respond(self, range_header):
+        with self.lock:
+            self.requests.append(range_header)
+            if self.mode == 'missing':
+                return 404, b'', {}
+            match = re.match(r'bytes=(\d+)-(\d+)$', range_header or '')
+            if self.mode == 'full' or match is None:
+                return 200, self.data, {}
+            start, end = int(match.group(1)), int(match.group(2))
+            if self.fail_segments and start >= self.fail_from:
+                self.fail_segments -= 1
+                return 500, b'', {}
+        return 206, self.data[start:end + 1], {'Content-Range': f"bytes {start}-{end}/{len(self.data)}"}
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def self_test(size=3 * 1024 * 1024 + 123, segment_size=256 * 1024, workers=DEFAULT_WORKERS):
+    # Returns a list of (check, passed, detail).
+    data = os.urandom(size)
+    sha1 = hashlib.sha1(data).hexdigest()
+    segments = -(-size // segment_size)
+    server = _RangeServer(data)
+    work_dir = tempfile.mkdtemp(prefix='downloader_test_')
+    target = os.path.join(work_dir, 'dataset.zip')
+    results = []
+
+    def check(name, passed, detail=''):
+        results.append((name, bool(passed), detail))
+
+    def expect_error(name, error_type, pattern, **kwargs):
+        try:
+            download(server.url, target, workers=workers, segment_size=segment_size, **kwargs)
+        except error_type as e:
+            check(name, re.search(pattern, str(e)), str(e))
+        else:
+            check(name, False, "no error raised")
+
+    try:
+        # A failing second half leaves the first half recorded in the state file...
+        server.fail_from, server.fail_segments = size // 2, 1000
+        expect_error("failed segment raises", Exception, r'500')
+        with open(target + '.part.json') as f:
+            saved = len(json.load(f)['done'])
+        check("finished segments are recorded", 0 < saved < segments, f"{saved}/{segments} segments saved")
+        # ...and the next run fetches only what is missing.
+        server.fail_segments = 0
+        server.requests.clear()
+        calls = []
+        download(server.url, target, expected_sha1=sha1, workers=workers, segment_size=segment_size,
+                 progress_callback=lambda done, total, rate: calls.append((done, total, rate)))
+        with open(target, 'rb') as f:
+            check("resumed download matches", f.read() == data)
+        check("resume skips finished segments", len(server.requests) == segments - saved,
+              f"{len(server.requests)} range requests for {segments - saved} missing segments")
+        # Callbacks come from several threads, so the last one is not always the largest.
+        check("progress reaches the total", calls and max(calls)[:2] == (size, size))
+        check("state file is removed", not os.path.exists(target + '.part.json'))
+        os.remove(target)
+        expect_error("SHA-1 mismatch raises", DownloadError, r'failed verification', expected_sha1='0' * 40)
+        check("mismatched file is discarded", not os.path.exists(target + '.part'))
+        server.mode = 'full'
+        expect_error("ignored range is reported", DownloadError, r'ignored range')
+        server.mode = 'missing'
+        expect_error("404 is reported as such", Exception, r'404')
+    finally:
+        server.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a file in parallel byte ranges, or test the "
+                                                 "downloader against a local Range server.")
+    parser.add_argument('url', nargs='?')
+    parser.add_argument('target', nargs='?')
+    parser.add_argument('--sha1')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--segment-mb', type=float, default=DEFAULT_SEGMENT_SIZE / (1024 * 1024))
+    parser.add_argument('--self-test', action='store_true', help="Check ranges, resume and verification locally")
+    args = parser.parse_args()
+    if args.self_test:
+        results = self_test(workers=args.workers)
+        for name, passed, detail in results:
+            print(f"{'ok  ' if passed else 'FAIL'} {name}" + (f" ({detail})" if detail else ""))
+        sys.exit(0 if all(passed for _, passed, _ in results) else 1)
+    if not args.url or not args.target:
+        parser.error("url and target are required unless --self-test is given")
+
+    def progress(done, total, rate):
+        print(f"{done / total if total else 0:.0%} ({rate / 1e6:.1f} MB/s)", end='\r')
+
+    download(args.url, args.target, expected_sha1=args.sha1, workers=args.workers,
+             segment_size=int(args.segment_mb * 1024 * 1024), progress_callback=progress)
+    print(f"\nSaved {args.target}")
+
+
+if __name__ == '__main__':
+    main()
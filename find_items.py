@@ -1,100 +1,329 @@
+import time
+_STARTUP_BEGIN = time.perf_counter()
 import tkinter as tk
-import random
+import tkinter.ttk as ttk
+import io
 import os
-import requests
-import zipfile
-import pygame
+import queue
 import threading
-import time
-import tempfile
-from pycocotools.coco import COCO
-from PIL import Image, ImageTk, ImageDraw
-from gtts import gTTS
+import atexit
+import getpass
+import logging
+from PIL import ImageTk
 import tkinter.messagebox as messagebox
+import dataset
+from dataset import (
+    AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_ENGINES, AUDIO_LANG, DATASET_DIR, MAX_SMALL_INSTANCES,
+    MIN_BBOX_SIZE, MIN_MULTI_INSTANCE_SIZE, THUMBNAIL_CACHE_MAX_BYTES, ensure_dataset_available,
+    get_round_index, load_annotations, load_quarantine, open_image_source, start_image_verifier,
+    thumbnail_cache_dir
+)
+from prefetch import RoundPrefetcher
+from thumbnail_cache import ThumbnailCache
+from audio_cache import AudioCache, make_engines
+from audio_engine import AudioEngine, PREEMPT, QUEUE
+from latency import record, span, timings
+from scheduler import CategoryScheduler
+from game_engine import (
+    CLICK_DEBOUNCE_MS, COMPLETE, DISPLAY_SIZE, FEEDBACK_PHRASES, FOUND, HIT_TEST_MODE, IGNORED, LEVELS, MISS,
+    GameEngine, RoundFactory, prompt_text
+)
 
 # --------------------------
-# COCO Dataset Configuration
-# -------------------------- 
-DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coco_dataset')
-COCO_ANNOTATION_FILE = os.path.join(DATASET_DIR, 'annotations/instances_val2017.json')
-COCO_IMAGES_DIR = os.path.join(DATASET_DIR, 'val2017/')
-
-COCO_ANNOTATIONS_URL = 'http://images.cocodataset.org/annotations/annotations_trainval2017.zip'
-COCO_VAL_IMAGES_URL = 'http://images.cocodataset.org/zips/val2017.zip'
-
-def download_file(url, target_path):
-    os.makedirs(os.path.dirname(target_path), exist_ok=True)
-    response = requests.get(url, stream=True)
-    with open(target_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-
-def extract_zip(zip_path, extract_dir):
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
-
-def ensure_dataset_available():
-    if os.path.exists(COCO_ANNOTATION_FILE) and os.path.exists(COCO_IMAGES_DIR):
-        return True
-    os.makedirs(DATASET_DIR, exist_ok=True)
-    annotations_zip = os.path.join(DATASET_DIR, 'annotations.zip')
+# Game Configuration
+# --------------------------
+# Dataset paths and loading live in dataset.py.
+PREFETCH_DEPTH = 4
+PREFETCH_WORKERS = 2
+PROMPT_MAX_AGE = 5.0
+# Weight categories by each learner's accuracy and speed instead of picking uniformly.
+ADAPTIVE_SCHEDULING = True
+
+# Time from process start until the level selection window is idle. Always
+# checked; a slower start logs a warning.
+STARTUP_TARGET_SECONDS = 0.5
+
+# Per-stage latency histograms, written on exit. Off unless FIND_ITEMS_TIMINGS
+# is set; F3 shows the live overlay and starts recording from then on.
+TIMINGS_ENABLED = bool(os.environ.get('FIND_ITEMS_TIMINGS'))
+TIMINGS_JSON = os.path.join(DATASET_DIR, 'timings.json')
+TIMINGS_CSV = os.path.join(DATASET_DIR, 'timings.csv')
+TIMINGS_OVERLAY_KEY = '<F3>'
+TIMINGS_OVERLAY_REFRESH_MS = 500
+
+# Every round, click and reveal is appended to a per-learner event log.
+PROGRESS_DB = os.path.join(DATASET_DIR, 'progress.db')
+LEARNER = os.environ.get('FIND_ITEMS_LEARNER') or getpass.getuser()
+
+# Set FIND_ITEMS_SERVER=http://host:port to play against server.py instead of
+# loading the dataset in this process.
+SERVER_URL = os.environ.get('FIND_ITEMS_SERVER')
+# Set FIND_ITEMS_PACK to one or more round_pack.py files (os.pathsep-separated)
+# to play those levels offline, without the dataset.
+PACK_FILES = [path for path in os.environ.get('FIND_ITEMS_PACK', '').split(os.pathsep) if path]
+# Images are verified in the background after startup (see verify.py).
+VERIFY_IN_BACKGROUND = True
+# Set by lab.py for each child window: the shared thumbnail pool to attach to
+# and where to place the window on screen.
+LAB_POOL = os.environ.get('FIND_ITEMS_LAB_POOL')
+WINDOW_POSITION = os.environ.get('FIND_ITEMS_WINDOW_POS', '')
+
+thumbnail_cache = None
+audio_cache = None
+audio_engine = None
+round_server = None
+round_packs = {}
+progress_store = None
+schedules = {}
+
+def init_audio():
+    global audio_engine
+    import pygame
+    pygame.mixer.init()
+    audio_engine = AudioEngine(synthesize_audio).start()
+
+def synthesize_audio(text):
+    with span('audio.synthesize'):
+        if round_server is not None:
+            return round_server.audio(text)
+        for pack in round_packs.values():
+            data = pack.audio(text)
+            if data:
+                return data
+        if audio_cache is not None:
+            return audio_cache.get(text)
+        from gtts import gTTS
+        buf = io.BytesIO()
+        gTTS(text=text, lang=AUDIO_LANG).write_to_fp(buf)
+        return buf.getvalue()
+
+def play_audio(text, data=None, policy=PREEMPT, max_age=None):
+    # Returns immediately; synthesis (on a cache miss) and playback happen on the audio engine thread.
+    if audio_engine is None:
+        return
+    if max_age is None:
+        audio_engine.play(text, data, policy)
+    else:
+        audio_engine.play(text, data, policy, max_age)
+
+def export_timings():
+    if not timings.histograms:
+        return
     try:
-        if not os.path.exists(annotations_zip):
-            download_file(COCO_ANNOTATIONS_URL, annotations_zip)
-        extract_zip(annotations_zip, DATASET_DIR)
-        val_images_zip = os.path.join(DATASET_DIR, 'val2017.zip')
-        if not os.path.exists(val_images_zip):
-            download_file(COCO_VAL_IMAGES_URL, val_images_zip)
+        os.makedirs(DATASET_DIR, exist_ok=True)
+        timings.export_json(TIMINGS_JSON)
+        timings.export_csv(TIMINGS_CSV)
+    except OSError:
+        pass
+
+def get_progress_store():
+    global progress_store
+    if progress_store is None:
+        from progress_store import ProgressStore
         try:
-            extract_zip(val_images_zip, DATASET_DIR)
-        except zipfile.BadZipFile:
-            os.remove(val_images_zip)
-            download_file(COCO_VAL_IMAGES_URL, val_images_zip)
-            extract_zip(val_images_zip, DATASET_DIR)
-        return True
-    except:
-        return False
-
-if not ensure_dataset_available():
-    pass
-
-try:
-    coco = COCO(COCO_ANNOTATION_FILE)
-except:
-    coco = None
-
-pygame.mixer.init()
-
-def play_audio(word):
+            os.makedirs(DATASET_DIR, exist_ok=True)
+            progress_store = ProgressStore(PROGRESS_DB).start()
+        except Exception:
+            return None
+        atexit.register(progress_store.close)
+    return progress_store
+
+def load_schedule(level):
+    # Runs on the startup thread: load_schedule() flushes the writer first and may block.
+    store = get_progress_store()
+    if store is None or level in schedules:
+        return
     try:
-        tts = gTTS(text=word, lang='en')
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-            temp_path = temp_file.name
-        tts.save(temp_path)
-        def play_in_thread():
+        schedules[level] = store.load_schedule(LEARNER, level)
+    except Exception:
+        pass
+
+def make_scheduler(factory, level, store=None):
+    # Picks up where this learner left off on this level, from the state the
+    # startup loader read, kept current here so replaying a level never reads back.
+    state = schedules.setdefault(level, {})
+    save = store.schedule_saver(LEARNER, level) if store is not None else None
+    def on_update(category, row):
+        state[category] = row
+        if save is not None:
+            save(category, row)
+    return CategoryScheduler(factory.categories, state, on_update, available=factory.has_category)
+
+def window_title(title):
+    # Lab windows sit side by side, so each one names its learner.
+    return f"{title} - {LEARNER}" if LAB_POOL else title
+
+def make_round_factory(round_index):
+    return RoundFactory(
+        dataset.coco, round_index, dataset.image_source, thumbnail_cache, synthesize_audio,
+        display_size=DISPLAY_SIZE, hit_test_mode=HIT_TEST_MODE
+    )
+
+class StartupLoader:
+    # Runs the slow startup work off the Tk thread; the UI drains `events` via poll().
+    def __init__(self, levels):
+        self.levels = levels
+        self.events = queue.Queue()
+        self.status = ("Starting...", 0.0)
+        self.ready_levels = set()
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def report(self, message, fraction):
+        self.events.put(('progress', message, fraction))
+
+    def run(self):
+        if SERVER_URL:
+            self.run_remote()
+            return
+        if PACK_FILES:
+            self.run_packs()
+            return
+        global thumbnail_cache, audio_cache
+        steps = 4 + len(self.levels)
+        self.report("Preparing audio...", 0 / steps)
+        try:
+            init_audio()
+        except:
+            pass
+        try:
+            audio_cache = AudioCache(AUDIO_CACHE_DIR, make_engines(AUDIO_ENGINES), AUDIO_CACHE_MAX_BYTES, AUDIO_LANG)
+        except OSError:
+            audio_cache = None
+        self.report("Checking dataset...", 1 / steps)
+        def download_progress(name, done, total, rate):
+            fraction = done / total if total else 0.0
+            self.report(f"Downloading {name}... {fraction:.0%} ({rate / 1e6:.1f} MB/s)", (1 + fraction) / steps)
+        ensure_dataset_available(download_progress)
+        self.report("Loading annotations...", 2 / steps)
+        def ingest_progress(name, done, total):
+            fraction = done / total if total else 1.0
+            self.report(f"Indexing {name} annotations... {fraction:.0%}", (2 + fraction) / steps)
+        coco = dataset.coco = load_annotations(ingest_progress)
+        image_source = dataset.image_source = open_image_source()
+        try:
+            load_quarantine()
+        except:
+            pass
+        try:
+            thumbnail_cache = ThumbnailCache(thumbnail_cache_dir(), THUMBNAIL_CACHE_MAX_BYTES)
+        except OSError:
+            thumbnail_cache = None
+        if LAB_POOL:
+            try:
+                from lab import SharedThumbnailPool
+                thumbnail_cache = SharedThumbnailPool(LAB_POOL, thumbnail_cache)
+            except (OSError, ValueError):
+                pass
+        get_progress_store()
+        for i, level in enumerate(self.levels):
+            self.report(f"Preparing level {level}...", (3 + i) / steps)
             try:
-                pygame.mixer.music.load(temp_path)
-                pygame.mixer.music.play()
-                while pygame.mixer.music.get_busy():
-                    time.sleep(0.1)
-                if os.path.exists(temp_path):
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
+                get_round_index(level, MIN_BBOX_SIZE, MIN_MULTI_INSTANCE_SIZE, MAX_SMALL_INSTANCES)
             except:
                 pass
-        threading.Thread(target=play_in_thread, daemon=True).start()
-    except:
-        pass
+            if ADAPTIVE_SCHEDULING:
+                load_schedule(level)
+            self.events.put(('level_ready', level))
+        if audio_cache is not None and coco is not None:
+            self.prewarm_audio(steps)
+        if coco is None:
+            self.report("Could not load the COCO dataset.", 1.0)
+        else:
+            self.report("Ready! Pick a level.", 1.0)
+        self.events.put(('done',))
+        # Lab windows share the supervisor's verification run instead.
+        if VERIFY_IN_BACKGROUND and coco is not None and image_source is not None and not LAB_POOL:
+            try:
+                start_image_verifier()
+            except:
+                pass
+
+    def run_remote(self):
+        global round_server
+        from game_client import RemoteServer
+        self.report("Preparing audio...", 0.0)
+        try:
+            init_audio()
+        except:
+            pass
+        self.report(f"Connecting to {SERVER_URL}...", 0.5)
+        try:
+            server = RemoteServer(SERVER_URL)
+            levels = server.health()['levels']
+        except Exception:
+            self.report(f"Could not reach the round server at {SERVER_URL}.", 1.0)
+            self.events.put(('done',))
+            return
+        round_server = server
+        for level in levels:
+            self.events.put(('level_ready', level))
+        self.report("Ready! Pick a level.", 1.0)
+        self.events.put(('done',))
+        if audio_engine is not None:
+            audio_engine.preload(FEEDBACK_PHRASES)
+
+    def run_packs(self):
+        from round_pack import RoundPack
+        self.report("Preparing audio...", 0.0)
+        try:
+            init_audio()
+        except:
+            pass
+        get_progress_store()
+        for i, path in enumerate(PACK_FILES):
+            self.report(f"Opening {os.path.basename(path)}...", (i + 1) / (len(PACK_FILES) + 1))
+            try:
+                pack = RoundPack(path)
+            except (OSError, ValueError):
+                continue
+            round_packs[pack.level] = pack
+            if ADAPTIVE_SCHEDULING:
+                load_schedule(pack.level)
+            self.events.put(('level_ready', pack.level))
+        if round_packs:
+            self.report("Ready! Pick a level.", 1.0)
+        else:
+            self.report("Could not open any round pack.", 1.0)
+        self.events.put(('done',))
+        if audio_engine is not None:
+            audio_engine.preload(FEEDBACK_PHRASES)
+
+    def prewarm_audio(self, steps):
+        coco = dataset.coco
+        names = [cat['name'] for cat in coco.loadCats(coco.getCatIds())]
+        texts = FEEDBACK_PHRASES + [prompt_text(name) for name in names]
+        def progress(done, total):
+            self.report(f"Preparing voices... {done}/{total}", (steps - 1 + done / total) / steps)
+        try:
+            audio_cache.prewarm(texts, progress_callback=progress)
+        except:
+            pass
+        if audio_engine is not None:
+            audio_engine.preload(FEEDBACK_PHRASES)
+
+    def poll(self):
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if event[0] == 'progress':
+                self.status = (event[1], event[2])
+            elif event[0] == 'level_ready':
+                self.ready_levels.add(event[1])
+            elif event[0] == 'done':
+                self.finished = True
 
 class LevelSelectionScreen:
     def __init__(self, root, on_level_select):
         self.root = root
         self.on_level_select = on_level_select
-        self.root.title("English Learning Game - Level Selection")
-        self.root.geometry("500x700")
+        self.root.title(window_title("English Learning Game - Level Selection"))
+        self.root.geometry("500x700" + WINDOW_POSITION)
         self.root.resizable(False, False)
         tk.Label(
             root,
@@ -124,12 +353,13 @@ class LevelSelectionScreen:
                 justify="left"
             ).pack(pady=5, anchor="w", padx=50)
         button_frame = tk.Frame(root)
-        button_frame.pack(pady=40)
+        button_frame.pack(pady=(40, 10))
         levels = [
             {"text": "Level 1", "color": "#90EE90", "max_objects": 1},
             {"text": "Level 2", "color": "#FFD700", "max_objects": 2},
             {"text": "Level 3", "color": "#FF9999", "max_objects": 3}
         ]
+        self.level_buttons = {}
         for level in levels:
             btn = tk.Button(
                 button_frame,
@@ -138,37 +368,131 @@ class LevelSelectionScreen:
                 bg=level["color"],
                 width=10,
                 height=2,
+                state="disabled",
                 command=lambda max_obj=level["max_objects"]: self.select_level(max_obj)
             )
             btn.pack(side="left", padx=10)
+            self.level_buttons[level["max_objects"]] = btn
+        self.status_label = tk.Label(
+            root,
+            text="",
+            font=("Comic Sans MS", 12),
+            fg="#555555"
+        )
+        self.status_label.pack(pady=(10, 5))
+        self.progress_bar = ttk.Progressbar(root, length=300, maximum=1.0)
+        self.progress_bar.pack()
         tk.Label(
             root,
             text="You can change the difficulty level later in the settings",
             font=("Comic Sans MS", 12, "italic"),
             fg="#888888"
         ).pack(pady=30)
+    def update_status(self, status, ready_levels):
+        message, fraction = status
+        self.status_label.config(text=message)
+        self.progress_bar.config(value=fraction)
+        for max_objects, btn in self.level_buttons.items():
+            btn.config(state="normal" if max_objects in ready_levels else "disabled")
     def select_level(self, max_objects):
         self.on_level_select(max_objects)
 
+class TimingsOverlay:
+    # Live p50/p95 per stage, drawn over whatever screen is showing. Nothing is
+    # scheduled while it is hidden, so it costs nothing until toggled on.
+    def __init__(self, root):
+        self.root = root
+        self.label = None
+        self.visible = False
+
+    def toggle(self, event=None):
+        self.visible = not self.visible
+        if self.visible:
+            timings.enabled = True
+            self.refresh()
+        elif self.label is not None and self.label.winfo_exists():
+            self.label.place_forget()
+
+    def refresh(self):
+        if not self.visible:
+            return
+        # Screen changes destroy every child of root, the overlay included.
+        if self.label is None or not self.label.winfo_exists():
+            self.label = tk.Label(self.root, font=("Courier", 9), justify="left", anchor="nw",
+                                  bg="#FFFFE0", relief="solid", bd=1)
+        lines = [f"{'stage':<22}{'p50':>8}{'p95':>8}{'n':>6}"]
+        for name, summary in timings.snapshot().items():
+            lines.append(f"{name:<22}{summary['p50_ms']:>6.1f}ms{summary['p95_ms']:>6.1f}ms{summary['count']:>6}")
+        self.label.config(text="\n".join(lines))
+        self.label.place(x=4, y=4)
+        self.label.lift()
+        self.root.after(TIMINGS_OVERLAY_REFRESH_MS, self.refresh)
+
 class EnglishLearningGUI:
     def __init__(self, root):
         self.root = root
+        self.loader = StartupLoader(LEVELS)
+        self.level_screen = None
+        self.prefetcher = None
+        self.engine = None
+        self.timings_overlay = TimingsOverlay(root)
+        root.bind_all(TIMINGS_OVERLAY_KEY, self.timings_overlay.toggle)
         self.show_level_selection()
+        self.loader.start()
+        self.poll_loader()
+    def poll_loader(self):
+        self.loader.poll()
+        if self.level_screen is not None:
+            self.level_screen.update_status(self.loader.status, self.loader.ready_levels)
+        if not self.loader.finished:
+            self.root.after(50, self.poll_loader)
     def show_level_selection(self):
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+        self.prefetcher = None
         for widget in self.root.winfo_children():
             widget.destroy()
         self.level_screen = LevelSelectionScreen(self.root, self.start_game)
+        self.level_screen.update_status(self.loader.status, self.loader.ready_levels)
     def start_game(self, max_objects):
         self.max_instances = max_objects
+        self.level_screen = None
         for widget in self.root.winfo_children():
             widget.destroy()
         self.setup_game_interface()
+        if round_server is not None:
+            try:
+                self.engine = round_server.new_game(self.max_instances)
+            except Exception:
+                self.show_image_message("Could not reach the round server.")
+                return
+            self.show_new_word()
+            return
+        factory = round_packs.get(self.max_instances)
+        if factory is None:
+            self.round_index = get_round_index(
+                self.max_instances, self.min_bbox_size, self.min_multi_instance_size, self.max_small_instances
+            )
+            factory = make_round_factory(self.round_index)
+        # Opened by the startup loader; not retried here, where it would block the UI.
+        store = progress_store
+        scheduler = make_scheduler(factory, self.max_instances, store) if ADAPTIVE_SCHEDULING else None
+        self.prefetcher = RoundPrefetcher(
+            factory.prepare,
+            scheduler.choose if scheduler is not None else factory.random_category,
+            depth=PREFETCH_DEPTH,
+            workers=PREFETCH_WORKERS
+        ).start()
+        on_event = store.recorder(LEARNER, self.max_instances) if store is not None else None
+        self.engine = GameEngine(factory, self.max_instances, self.prefetcher, CLICK_DEBOUNCE_MS,
+                                 on_event=on_event, scheduler=scheduler)
         self.show_new_word()
     def setup_game_interface(self):
-        self.root.title("Learn English Words with COCO Images!")
-        self.root.geometry("500x700")
+        self.root.title(window_title("Learn English Words with COCO Images!"))
+        self.root.geometry("500x700" + WINDOW_POSITION)
         self.root.resizable(False, False)
-        if coco is None:
+        if dataset.coco is None and round_server is None and not round_packs:
             messagebox.showerror("Error", "Could not initialize COCO API. Please check dataset availability.")
         self.level_indicator = tk.Label(
             self.root, 
@@ -206,9 +530,15 @@ class EnglishLearningGUI:
         self.feedback_label.pack(pady=5)
         self.image_frame = tk.Frame(self.root)
         self.image_frame.pack(pady=10)
-        self.image_label = tk.Label(self.image_frame)
-        self.image_label.pack()
-        self.image_label.bind("<Button-1>", self.check_click)
+        self.image_canvas = tk.Canvas(
+            self.image_frame,
+            width=DISPLAY_SIZE[0],
+            height=DISPLAY_SIZE[1],
+            highlightthickness=0,
+            bd=0
+        )
+        self.image_canvas.pack()
+        self.image_canvas.bind("<Button-1>", self.check_click)
         btn_frame = tk.Frame(self.root)
         btn_frame.pack(pady=20)
         tk.Button(
@@ -247,276 +577,153 @@ class EnglishLearningGUI:
             padx=10,
             pady=5
         ).pack(side="left", padx=10)
-        self.current_word = None
-        self.current_category = None
-        self.current_bboxes = []
-        self.score = 0
+        self.engine = None
         self.image_scale = (1, 1)
-        self.last_pil_img = None
-        self.correct_answers = 0
-        self.incorrect_answers = 0
-        self.response_times = []
-        self.question_start_time = 0
-        self.total_response_time = 0
-        self.learning_mode = False
-        self.repetitions_left = 0
-        self.current_learning_category = None
-        self.transitioning = False
-        self.last_click_time = 0
-        self.click_debounce_ms = 100
-        self.min_bbox_size = 80
-        self.min_multi_instance_size = 80
-        self.max_small_instances = 3
-        self.instances_found = set()
-        self.total_instances = 0
-        self.incorrect_clicks = []
+        self.current_prompt_audio = None
+        self.min_bbox_size = MIN_BBOX_SIZE
+        self.min_multi_instance_size = MIN_MULTI_INSTANCE_SIZE
+        self.max_small_instances = MAX_SMALL_INSTANCES
 
     def show_new_word(self):
-        self.transitioning = False
+        if self.engine is None:
+            return
+        with span('ui.show_new_word'):
+            self._show_new_word()
+
+    def _show_new_word(self):
         self.feedback_label.config(text="")
-        self.current_bboxes = []
-        self.instances_found = set()
-        self.total_instances = 0
-        self.incorrect_clicks = []
-        self.question_start_time = time.time()
         self.show_answers_button.pack_forget()
-        if self.learning_mode and self.repetitions_left > 0:
-            self.current_category = self.current_learning_category
-            self.repetitions_left -= 1
-            self.feedback_label.config(text=f"Learning '{self.current_word}' - {self.repetitions_left+1} remaining", fg="#1E90FF")
-            if self.repetitions_left <= 0:
-                self.learning_mode = False
-        else:
-            cat_ids = coco.getCatIds()
-            if not cat_ids:
-                self.image_label.config(text="No COCO categories available.", image="")
-                return
-            cats = coco.loadCats(cat_ids)
-            random_cat = random.choice(cats)
-            cat_name = random_cat['name']
-            self.current_word = cat_name
-            self.current_category = cat_name.lower()
-        if not self.learning_mode:
-            self.word_label.config(text=f"Find {self.current_category}")
-        self.definition_label.config(text="Click on the image where you see the object")
-        cat_ids = coco.getCatIds(catNms=[self.current_category])
-        if not cat_ids:
-            self.image_label.config(text=f"No COCO category named '{self.current_category}' found.", image="")
-            return
-        image_ids = coco.getImgIds(catIds=cat_ids)
-        if not image_ids:
-            self.image_label.config(text="No images available for this category.", image="")
+        self.current_prompt_audio = None
+        round_info = self.engine.next_round()
+        if round_info.get('learning_remaining'):
+            self.feedback_label.config(
+                text=f"Learning '{self.engine.current_word}' - {round_info['learning_remaining']} remaining",
+                fg="#1E90FF"
+            )
+        if 'error' in round_info:
+            if round_info.get('category') and not self.engine.learning_mode:
+                self.word_label.config(text=prompt_text(round_info['category']))
+            self.show_image_message(round_info['error'])
             return
-        max_attempts = 5
-        for attempt in range(max_attempts):
-            random_img_id = random.choice(image_ids)
-            img_info = coco.loadImgs(random_img_id)[0]
-            img_path = os.path.join(COCO_IMAGES_DIR, img_info['file_name'])
-            try:
-                pil_img = Image.open(img_path)
-                orig_width, orig_height = pil_img.size
-                ann_ids = coco.getAnnIds(imgIds=random_img_id, catIds=cat_ids, iscrowd=None)
-                anns = coco.loadAnns(ann_ids)
-                temp_bboxes = []
-                small_instances_count = 0
-                for ann in anns:
-                    if ann['category_id'] in cat_ids:
-                        bbox = ann['bbox']
-                        x, y, w, h = [int(v) for v in bbox]
-                        if w < self.min_multi_instance_size or h < self.min_multi_instance_size:
-                            small_instances_count += 1
-                        if w >= self.min_bbox_size and h >= self.min_bbox_size:
-                            temp_bboxes.append((x, y, x+w, y+h))
-                if len(temp_bboxes) > 1 and small_instances_count > self.max_small_instances:
-                    continue
-                if len(temp_bboxes) > self.max_instances:
-                    continue
-                if temp_bboxes:
-                    self.current_bboxes = temp_bboxes
-                    break
-            except:
-                pass
-        if not self.current_bboxes:
-            if not self.learning_mode:
-                self.show_new_word()
-                return
-            else:
-                self.image_label.config(text=f"No suitable images found for '{self.current_category}'.", image="")
-                return
-        self.total_instances = len(self.current_bboxes)
-        if self.total_instances > 1:
-            self.definition_label.config(text=f"Find ALL {self.total_instances} instances of this object!")
+        if not round_info['learning_mode']:
+            self.word_label.config(text=prompt_text(round_info['category']))
+        self.definition_label.config(text="Click on the image where you see the object")
+        total_instances = round_info['total_instances']
+        if total_instances > 1:
+            self.definition_label.config(text=f"Find ALL {total_instances} instances of this object!")
             self.show_answers_button.pack(side="left", padx=10)
-        else:
-            self.show_answers_button.pack_forget()
-        display_width, display_height = 300, 300
-        self.image_scale = (display_width / orig_width, display_height / orig_height)
-        pil_img = pil_img.resize((display_width, display_height), Image.Resampling.LANCZOS)
-        self.last_pil_img = pil_img.copy()
-        self.photo = ImageTk.PhotoImage(pil_img)
-        self.image_label.config(image=self.photo, text="")
-        self.image_label.image = self.photo
+        prepared = round_info['prepared']
+        self.image_scale = prepared['scale']
+        with span('ui.photo_image'):
+            self.photo = ImageTk.PhotoImage(prepared['image'])
+            self.image_canvas.delete("all")
+            self.image_canvas.create_image(0, 0, image=self.photo, anchor="nw")
+        self.current_prompt_audio = prepared['audio']
         self.play_word_audio()
 
     def check_click(self, event):
-        if not self.current_bboxes:
+        if self.engine is None:
             return
-        current_time = int(time.time() * 1000)
-        if self.transitioning or (current_time - self.last_click_time < self.click_debounce_ms):
+        with span('ui.check_click'):
+            self._check_click(event)
+
+    def _check_click(self, event):
+        feedback = self.engine.submit_click(event.x, event.y)
+        result = feedback['result']
+        if result == IGNORED:
             return
-        self.last_click_time = current_time
-        x, y = event.x, event.y
-        original_x = x / self.image_scale[0]
-        original_y = y / self.image_scale[1]
-        found_object = False
-        for i, bbox in enumerate(self.current_bboxes):
-            x1, y1, x2, y2 = bbox
-            if x1 <= original_x <= x2 and y1 <= original_y <= y2:
-                if i not in self.instances_found:
-                    self.instances_found.add(i)
-                    found_object = True
-                    break
-        if found_object:
-            instances_found_count = len(self.instances_found)
-            if self.last_pil_img:
-                img_copy = self.last_pil_img.copy()
-                draw = ImageDraw.Draw(img_copy)
-                scale_x, scale_y = self.image_scale
-                for i in self.instances_found:
-                    x1, y1, x2, y2 = self.current_bboxes[i]
-                    draw.rectangle(
-                        [(x1 * scale_x, y1 * scale_y), (x2 * scale_x, y2 * scale_y)],
-                        outline="green",
-                        width=3
-                    )
-                for ix, iy in self.incorrect_clicks:
-                    ix_display = ix * scale_x
-                    iy_display = iy * scale_y
-                    size = 5
-                    draw.line([(ix_display-size, iy_display-size), (ix_display+size, iy_display+size)], fill="red", width=2)
-                    draw.line([(ix_display-size, iy_display+size), (ix_display+size, iy_display-size)], fill="red", width=2)
-                self.photo = ImageTk.PhotoImage(img_copy)
-                self.image_label.config(image=self.photo)
-                self.image_label.image = self.photo
-            if instances_found_count < self.total_instances:
-                self.feedback_label.config(
-                    text=f"✓ Good job! Find {self.total_instances - instances_found_count} more!", 
-                    fg="#008000"
-                )
-                play_audio("Good job! Find more!")
-            else:
-                response_time = time.time() - self.question_start_time
-                if not self.learning_mode:
-                    self.correct_answers += 1
-                    self.response_times.append(response_time)
-                    self.total_response_time += response_time
-                    self.correct_value.config(text=str(self.correct_answers))
-                    avg_time = self.total_response_time / len(self.response_times)
-                    self.avg_time_value.config(text=f"{avg_time:.1f}s")
-                    self.calculate_score()
-                self.feedback_label.config(text="✓ Great! You found all of them!", fg="#008000")
-                play_audio("Great! You found all of them!")
-                self.transitioning = True
-                self.root.after(1500, self.safe_show_new_word)
-        else:
-            self.incorrect_clicks.append((original_x, original_y))
-            if not self.learning_mode:
-                self.incorrect_answers += 1
-                self.incorrect_value.config(text=str(self.incorrect_answers))
-                self.calculate_score()
-            if self.last_pil_img:
-                img_copy = self.last_pil_img.copy()
-                draw = ImageDraw.Draw(img_copy)
-                scale_x, scale_y = self.image_scale
-                for i in self.instances_found:
-                    x1, y1, x2, y2 = self.current_bboxes[i]
-                    draw.rectangle(
-                        [(x1 * scale_x, y1 * scale_y), (x2 * scale_x, y2 * scale_y)], 
-                        outline="green",
-                        width=3
-                    )
-                for ix, iy in self.incorrect_clicks:
-                    ix_display = ix * scale_x
-                    iy_display = iy * scale_y
-                    size = 5
-                    draw.line([(ix_display-size, iy_display-size), (ix_display+size, iy_display+size)], fill="red", width=2)
-                    draw.line([(ix_display-size, iy_display+size), (ix_display+size, iy_display-size)], fill="red", width=2)
-                self.photo = ImageTk.PhotoImage(img_copy)
-                self.image_label.config(image=self.photo)
-                self.image_label.image = self.photo
-            if len(self.incorrect_clicks) >= 3 and self.total_instances > 1:
+        if result in (FOUND, COMPLETE):
+            self.draw_box(feedback['instance'], "green")
+            self.feedback_label.config(text=feedback['message'], fg="#008000")
+        elif result == MISS:
+            self.draw_incorrect_click(*feedback['point'])
+            if feedback['highlight_answers']:
                 self.show_answers_button.config(bg="#FF6347")
-            self.feedback_label.config(text="✗ Try again!", fg="#FF0000")
-            play_audio("Try again")
-            if not self.learning_mode and len(self.incorrect_clicks) >= 5:
-                self.learning_mode = True
-                self.repetitions_left = 3
-                self.current_learning_category = self.current_category
-                self.current_word = self.current_category.capitalize()
+            self.feedback_label.config(text=feedback['message'], fg="#FF0000")
+        self.update_score_labels()
+        play_audio(feedback['speech'])
+        if result == COMPLETE:
+            self.root.after(feedback['advance_after_ms'], self.safe_show_new_word)
 
     def show_answers(self):
-        if not self.learning_mode:
-            missed_count = self.total_instances - len(self.instances_found)
-            if missed_count > 0:
-                self.incorrect_answers += missed_count
-                self.incorrect_value.config(text=str(self.incorrect_answers))
-                self.calculate_score()
-        if self.last_pil_img:
-            img_copy = self.last_pil_img.copy()
-            draw = ImageDraw.Draw(img_copy)
-            scale_x, scale_y = self.image_scale
-            for i, (x1, y1, x2, y2) in enumerate(self.current_bboxes):
-                color = "green" if i in self.instances_found else "red"
-                draw.rectangle(
-                    [(x1 * scale_x, y1 * scale_y), (x2 * scale_x, y2 * scale_y)],
-                    outline=color,
-                    width=3
-                )
-            for ix, iy in self.incorrect_clicks:
-                ix_display = ix * scale_x
-                iy_display = iy * scale_y
-                size = 5
-                draw.line([(ix_display-size, iy_display-size), (ix_display+size, iy_display+size)], fill="red", width=2)
-                draw.line([(ix_display-size, iy_display+size), (ix_display+size, iy_display-size)], fill="red", width=2)
-            self.photo = ImageTk.PhotoImage(img_copy)
-            self.image_label.config(image=self.photo)
-            self.image_label.image = self.photo
-        missed_count = self.total_instances - len(self.instances_found)
-        if missed_count > 0:
-            self.feedback_label.config(
-                text=f"You missed {missed_count} {self.current_category}(s)", 
-                fg="#FF0000"
-            )
-            play_audio(f"You missed {missed_count} objects")
-        if not self.learning_mode:
-            self.learning_mode = True
-            self.repetitions_left = 3
-            self.current_learning_category = self.current_category
-            self.current_word = self.current_category.capitalize()
-        self.transitioning = True
-        self.root.after(3000, self.safe_show_new_word)
+        if self.engine is None:
+            return
+        with span('ui.show_answers'):
+            self._show_answers()
+
+    def _show_answers(self):
+        feedback = self.engine.reveal_answers()
+        if feedback.get('result') == IGNORED:
+            return
+        for i in feedback['missed']:
+            self.draw_box(i, "red")
+        self.update_score_labels()
+        if feedback['message']:
+            self.feedback_label.config(text=feedback['message'], fg="#FF0000")
+            play_audio(feedback['speech'])
+        self.root.after(feedback['advance_after_ms'], self.safe_show_new_word)
+
+    def update_score_labels(self):
+        stats = self.engine.stats()
+        self.score_value.config(text=str(stats['score']))
+        self.correct_value.config(text=str(stats['correct']))
+        self.incorrect_value.config(text=str(stats['incorrect']))
+        self.avg_time_value.config(text=f"{stats['avg_time']:.1f}s")
+
+    def show_image_message(self, text):
+        self.image_canvas.delete("all")
+        self.image_canvas.create_text(
+            DISPLAY_SIZE[0] / 2,
+            DISPLAY_SIZE[1] / 2,
+            text=text,
+            width=DISPLAY_SIZE[0] - 20,
+            font=("Comic Sans MS", 12),
+            justify="center"
+        )
+
+    # Overlays are canvas items added one per click on top of the round's image,
+    # so feedback never re-encodes the picture. Click markers stay above boxes.
+    def draw_box(self, i, color):
+        x1, y1, x2, y2 = self.engine.round['bboxes'][i]
+        scale_x, scale_y = self.image_scale
+        self.image_canvas.create_rectangle(
+            x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y,
+            outline=color,
+            width=3,
+            tags=("overlay", "box")
+        )
+        self.image_canvas.tag_raise("marker")
+
+    def draw_incorrect_click(self, x, y):
+        scale_x, scale_y = self.image_scale
+        ix_display = x * scale_x
+        iy_display = y * scale_y
+        size = 5
+        self.image_canvas.create_line(ix_display-size, iy_display-size, ix_display+size, iy_display+size,
+                                      fill="red", width=2, tags=("overlay", "marker"))
+        self.image_canvas.create_line(ix_display-size, iy_display+size, ix_display+size, iy_display-size,
+                                      fill="red", width=2, tags=("overlay", "marker"))
 
     def safe_show_new_word(self):
-        if self.transitioning:
+        if self.engine is not None and self.engine.transitioning:
             self.show_new_word()
-    
+
     def play_word_audio(self):
-        if self.current_word:
-            play_audio(f"Find {self.current_word}")
+        if self.engine is not None and self.engine.current_category and self.engine.round:
+            # Queued so the prompt does not cut off the feedback for the previous round.
+            play_audio(prompt_text(self.engine.current_category), self.current_prompt_audio, QUEUE, PROMPT_MAX_AGE)
 
-    def calculate_score(self):
-        if self.correct_answers == 0:
-            self.score = 0
-            self.score_value.config(text="0")
-            return
-        total_attempts = self.correct_answers + self.incorrect_answers
-        accuracy = (self.correct_answers / total_attempts) * 100
-        avg_time = self.total_response_time / len(self.response_times)
-        speed_bonus = max(0, 50 - min(50, avg_time * 5))  
-        self.score = int(accuracy + speed_bonus)
-        self.score_value.config(text=str(self.score))
+def report_startup_time():
+    elapsed = time.perf_counter() - _STARTUP_BEGIN
+    record('startup.ready', elapsed)
+    if elapsed > STARTUP_TARGET_SECONDS:
+        logging.getLogger(__name__).warning("Startup took %.2fs (target %.2fs)", elapsed, STARTUP_TARGET_SECONDS)
+    return elapsed
 
 if __name__ == '__main__':
+    timings.enabled = TIMINGS_ENABLED
+    atexit.register(export_timings)
     root = tk.Tk()
     app = EnglishLearningGUI(root)
+    root.after_idle(report_startup_time)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,136 @@
+import io
+import threading
+from PIL import Image
+from game_engine import ANSWERS_ADVANCE_MS, IGNORED
+
+# --------------------------
+# Round server client
+# --------------------------
+# RemoteGame mirrors the parts of GameEngine that EnglishLearningGUI uses, so
+# the Tk window can play against server.py instead of loading the dataset.
+DEFAULT_TIMEOUT = 10.0
+CONNECTION_LOST = "Lost connection to the round server."
+
+
+class RemoteServer:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.audio_clips = {}
+
+    def _request(self, method, path, body=None):
+        # requests.Session is not thread-safe; the UI and audio threads share this one.
+        with self.lock:
+            response = self.session.request(method, self.base_url + path, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def get_json(self, path):
+        return self._request('GET', path).json()
+
+    def post(self, path, body=None):
+        return self._request('POST', path, body or {}).json()
+
+    def delete(self, path):
+        return self._request('DELETE', path).json()
+
+    def get_bytes(self, path):
+        return self._request('GET', path).content
+
+    def health(self):
+        return self.get_json('/health')
+
+    def audio(self, text):
+        data = self.audio_clips.get(text)
+        if data is None:
+            from urllib.parse import quote
+            data = self.get_bytes(f"/audio?text={quote(text)}")
+            self.audio_clips[text] = data
+        return data
+
+    def new_game(self, level):
+        return RemoteGame(self, level)
+
+
+class RemoteGame:
+    def __init__(self, server, level):
+        self.server = server
+        self.level = level
+        self.session_id = server.post('/sessions', {'level': level})['session']
+        self.round = None
+        self.current_word = None
+        self.current_category = None
+        self.learning_mode = False
+        self.transitioning = False
+        self.last_stats = {'score': 0, 'correct': 0, 'incorrect': 0, 'avg_time': 0.0, 'learning_mode': False}
+
+    def _call(self, action):
+        response = self.server.post(f"/sessions/{self.session_id}/{action}")
+        return self._update(response)
+
+    def _update(self, response):
+        state = response.pop('state', None)
+        if state:
+            self.learning_mode = state['learning_mode']
+            self.transitioning = state['transitioning']
+            self.current_word = state['current_word']
+            self.current_category = state['current_category']
+        stats = response.pop('stats', None)
+        if stats:
+            self.last_stats = stats
+        return response
+
+    def stats(self):
+        return self.last_stats
+
+    def next_round(self):
+        self.round = None
+        try:
+            info = self._call('next')
+            if 'error' in info:
+                return info
+            image = Image.open(io.BytesIO(self.server.get_bytes(info['image_url'])))
+            image.load()
+            audio = None
+            try:
+                audio = self.server.audio(info['prompt'])
+            except Exception:
+                pass
+        except Exception:
+            return {'error': CONNECTION_LOST}
+        prepared = {
+            'category': info['category'],
+            'image': image,
+            'bboxes': [tuple(bbox) for bbox in info['bboxes']],
+            'scale': tuple(info['scale']),
+            'audio': audio,
+        }
+        self.round = prepared
+        return dict(info, prepared=prepared)
+
+    def submit_click(self, x, y):
+        if not self.round:
+            return {'result': IGNORED}
+        try:
+            response = self.server.post(f"/sessions/{self.session_id}/click", {'x': x, 'y': y})
+        except Exception:
+            return {'result': IGNORED}
+        return self._update(response)
+
+    def reveal_answers(self):
+        if not self.round:
+            return {'result': IGNORED}
+        try:
+            return self._call('answers')
+        except Exception:
+            self.transitioning = True
+            return {'missed': [], 'message': CONNECTION_LOST, 'speech': None, 'advance_after_ms': ANSWERS_ADVANCE_MS}
+
+    def close(self):
+        try:
+            self.server.delete(f"/sessions/{self.session_id}")
+        except Exception:
+            pass
@@ -0,0 +1,373 @@
+import time
+import zipfile
+import zlib
+from PIL import Image
+from latency import span
+
+# --------------------------
+# Headless game engine
+# --------------------------
+# Round selection, click adjudication, scoring and learning-mode transitions,
+# with no Tk in sight. The GUI (and anything else: benchmarks, servers) drives
+# a GameEngine and renders what it returns.
+LEVELS = (1, 2, 3)
+DISPLAY_SIZE = (300, 300)
+ROUND_ADVANCE_MS = 1500
+ANSWERS_ADVANCE_MS = 3000
+LEARNING_REPETITIONS = 3
+MISSES_BEFORE_HINT = 3
+MISSES_BEFORE_LEARNING = 5
+MAX_PICK_ATTEMPTS = 5
+CLICK_DEBOUNCE_MS = 100
+# 'mask' tests clicks against instance segmentations, 'bbox' against bounding boxes only.
+HIT_TEST_MODE = 'mask'
+# What image sources and Pillow raise when the file itself is missing or cannot
+# be decoded (UnidentifiedImageError and truncated data are OSErrors).
+IMAGE_ERRORS = (OSError, KeyError, zipfile.BadZipFile, zlib.error, Image.DecompressionBombError)
+
+TRY_AGAIN = "Try again"
+GOOD_JOB = "Good job! Find more!"
+ALL_FOUND = "Great! You found all of them!"
+
+IGNORED = 'ignored'
+FOUND = 'found'
+COMPLETE = 'complete'
+MISS = 'miss'
+
+
+def prompt_text(category):
+    return f"Find {category}"
+
+
+def missed_text(count):
+    return f"You missed {count} objects"
+
+
+FEEDBACK_PHRASES = [TRY_AGAIN, GOOD_JOB, ALL_FOUND] + [missed_text(n) for n in range(1, max(LEVELS) + 1)]
+
+
+class RoundFactory:
+    # Builds everything a round needs except UI objects (a Tk PhotoImage must be
+    # created on the UI thread). Safe to call from prefetch workers.
+    def __init__(self, coco, round_index, image_source, thumbnail_cache=None, synthesize=None,
+                 display_size=DISPLAY_SIZE, hit_test_mode=HIT_TEST_MODE):
+        self.coco = coco
+        self.round_index = round_index
+        self.image_source = image_source
+        self.thumbnail_cache = thumbnail_cache
+        self.synthesize = synthesize
+        self.display_size = display_size
+        self.hit_test_mode = hit_test_mode
+
+    @property
+    def categories(self):
+        return self.round_index.categories
+
+    def random_category(self):
+        return self.round_index.random_category()
+
+    def has_category(self, category):
+        return self.round_index.has_category(category)
+
+    def prepare(self, category):
+        with span('prepare.total'):
+            return self._prepare(category)
+
+    def _prepare(self, category):
+        rendered = None
+        for attempt in range(MAX_PICK_ATTEMPTS):
+            with span('prepare.pick'):
+                entry = self.round_index.pick(category)
+            if entry is None:
+                return None
+            try:
+                rendered = self.render(entry)
+                break
+            except IMAGE_ERRORS:
+                # Keep an unreadable image from burning attempts again this session.
+                self.round_index.exclude([entry['file_name']])
+                rendered = None
+            except Exception:
+                # Anything else (a cache failure, say) is not the image's fault.
+                rendered = None
+        if rendered is None:
+            return None
+        audio = None
+        if self.synthesize is not None:
+            try:
+                with span('prepare.audio'):
+                    audio = self.synthesize(prompt_text(category))
+            except Exception:
+                audio = None
+        return dict(rendered, category=category, entry=entry, bboxes=entry['bboxes'], audio=audio)
+
+    def render(self, entry):
+        # The display-size image and hit-test label map for one index entry.
+        # Raises if the image cannot be read.
+        display_size = self.display_size
+        load = lambda: self.image_source.open(entry['file_name'])
+        if self.thumbnail_cache is not None:
+            pil_img = self.thumbnail_cache.get(entry['image_id'], load, display_size, Image.Resampling.LANCZOS)
+            orig_width, orig_height = entry['width'], entry['height']
+        else:
+            with span('image.decode'):
+                pil_img = load()
+                pil_img.load()
+            orig_width, orig_height = pil_img.size
+            with span('image.resize'):
+                pil_img = pil_img.resize(display_size, Image.Resampling.LANCZOS)
+        label_map = None
+        if self.hit_test_mode == 'mask':
+            try:
+                from hit_masks import build_label_map
+                with span('prepare.load_anns'):
+                    anns = {ann['id']: ann for ann in self.coco.loadAnns(entry['ann_ids'])}
+                with span('prepare.label_map'):
+                    label_map = build_label_map(
+                        [anns.get(ann_id) for ann_id in entry['ann_ids']], entry['bboxes'],
+                        (orig_width, orig_height), display_size
+                    )
+            except Exception:
+                label_map = None
+        return {
+            'image': pil_img,
+            'scale': (display_size[0] / orig_width, display_size[1] / orig_height),
+            'label_map': label_map,
+        }
+
+
+class RunningStats:
+    # Welford's online mean/variance: O(1) per sample, no sample list kept.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class GameEngine:
+    # on_event(event) is called with a dict for every round, click outcome,
+    # reveal and learning-mode switch, e.g. to persist a learner's history.
+    # A scheduler (see scheduler.py) replaces uniform category sampling and is
+    # told how every scored round went; with a prefetcher it should also be the
+    # prefetcher's pick_category.
+    def __init__(self, factory, max_instances, prefetcher=None, click_debounce_ms=CLICK_DEBOUNCE_MS, clock=time.time,
+                 on_event=None, scheduler=None):
+        self.factory = factory
+        self.max_instances = max_instances
+        self.prefetcher = prefetcher
+        self.click_debounce_ms = click_debounce_ms
+        self.clock = clock
+        self.on_event = on_event
+        self.scheduler = scheduler
+        self.round = None
+        self.current_word = None
+        self.current_category = None
+        self.score = 0
+        self.correct_answers = 0
+        self.incorrect_answers = 0
+        self.response_times = RunningStats()
+        self.question_start_time = 0
+        self.learning_mode = False
+        self.repetitions_left = 0
+        self.current_learning_category = None
+        self.transitioning = False
+        self.last_click_time = 0
+        self.instances_found = set()
+        self.incorrect_clicks = []
+
+    @property
+    def total_instances(self):
+        return len(self.round['bboxes']) if self.round else 0
+
+    @property
+    def avg_response_time(self):
+        return self.response_times.mean
+
+    def _emit(self, kind, value=None):
+        if self.on_event is not None:
+            self.on_event({'kind': kind, 'ts': self.clock(), 'category': self.current_category,
+                           'learning': self.learning_mode, 'value': value})
+
+    def _record_outcome(self, score, response_time=None):
+        if self.scheduler is not None:
+            self.scheduler.record(self.current_category, score, response_time)
+
+    def _pick_category(self):
+        if self.scheduler is not None:
+            return self.scheduler.choose()
+        return self.factory.random_category()
+
+    def stats(self):
+        return {
+            'score': self.score,
+            'correct': self.correct_answers,
+            'incorrect': self.incorrect_answers,
+            'avg_time': self.avg_response_time,
+            'learning_mode': self.learning_mode,
+        }
+
+    def _get_prepared(self, category):
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.get(category)
+
+    def next_round(self):
+        with span('round.next'):
+            return self._next_round()
+
+    def _next_round(self):
+        self.transitioning = False
+        self.round = None
+        self.instances_found = set()
+        self.incorrect_clicks = []
+        self.question_start_time = self.clock()
+        learning_remaining = None
+        if self.learning_mode and self.repetitions_left > 0:
+            self.current_category = self.current_learning_category
+            self.repetitions_left -= 1
+            learning_remaining = self.repetitions_left + 1
+            if self.repetitions_left <= 0:
+                self.learning_mode = False
+            prepared = self._get_prepared(self.current_category)
+        else:
+            with span('round.sample_category'):
+                prepared = self._get_prepared(None)
+                cat_name = prepared['category'] if prepared is not None else self._pick_category()
+            if cat_name is None:
+                return {'error': "No COCO categories available."}
+            self.current_word = cat_name
+            self.current_category = cat_name.lower()
+        if prepared is None:
+            # Prefetch miss: the caller waits for the whole preparation.
+            with span('round.prepare_sync'):
+                prepared = self.factory.prepare(self.current_category)
+        if prepared is None:
+            return {'error': f"No suitable images found for '{self.current_category}'.",
+                    'category': self.current_category}
+        self.round = prepared
+        self._emit('round', self.total_instances)
+        return {
+            'category': self.current_category,
+            'word': self.current_word,
+            'prompt': prompt_text(self.current_category),
+            'learning_mode': self.learning_mode,
+            'learning_remaining': learning_remaining,
+            'total_instances': self.total_instances,
+            'prepared': prepared,
+        }
+
+    def hit_test(self, x, y):
+        # x, y are display coordinates. Returns the index of an unfound instance or None.
+        label_map = self.round.get('label_map')
+        if label_map is not None:
+            height, width = label_map.shape
+            label = int(label_map[y, x]) if 0 <= x < width and 0 <= y < height else 0
+            if label and label - 1 not in self.instances_found:
+                return label - 1
+            return None
+        scale_x, scale_y = self.round['scale']
+        original_x, original_y = x / scale_x, y / scale_y
+        for i, (x1, y1, x2, y2) in enumerate(self.round['bboxes']):
+            if x1 <= original_x <= x2 and y1 <= original_y <= y2:
+                if i not in self.instances_found:
+                    return i
+        return None
+
+    def submit_click(self, x, y):
+        if not self.round or not self.round['bboxes']:
+            return {'result': IGNORED}
+        current_time = int(self.clock() * 1000)
+        if self.transitioning or (current_time - self.last_click_time < self.click_debounce_ms):
+            return {'result': IGNORED}
+        self.last_click_time = current_time
+        with span('click.hit_test'):
+            hit = self.hit_test(x, y)
+        if hit is not None:
+            self.instances_found.add(hit)
+            remaining = self.total_instances - len(self.instances_found)
+            if remaining > 0:
+                self._emit(FOUND)
+                return {'result': FOUND, 'instance': hit, 'remaining': remaining,
+                        'message': f"✓ Good job! Find {remaining} more!", 'speech': GOOD_JOB}
+            response_time = self.clock() - self.question_start_time
+            if not self.learning_mode:
+                self.correct_answers += 1
+                self.response_times.add(response_time)
+                self.calculate_score()
+                self._record_outcome(1.0 / (1 + len(self.incorrect_clicks)), response_time)
+            self._emit(COMPLETE, response_time)
+            self.transitioning = True
+            return {'result': COMPLETE, 'instance': hit, 'remaining': 0, 'response_time': response_time,
+                    'message': "✓ Great! You found all of them!", 'speech': ALL_FOUND,
+                    'advance_after_ms': ROUND_ADVANCE_MS}
+        scale_x, scale_y = self.round['scale']
+        point = (x / scale_x, y / scale_y)
+        self.incorrect_clicks.append(point)
+        if not self.learning_mode:
+            self.incorrect_answers += 1
+            self.calculate_score()
+        self._emit(MISS)
+        feedback = {'result': MISS, 'point': point, 'message': "✗ Try again!", 'speech': TRY_AGAIN,
+                    'highlight_answers': len(self.incorrect_clicks) >= MISSES_BEFORE_HINT and self.total_instances > 1,
+                    'entered_learning': False}
+        if not self.learning_mode and len(self.incorrect_clicks) >= MISSES_BEFORE_LEARNING:
+            self.enter_learning_mode()
+            feedback['entered_learning'] = True
+        return feedback
+
+    def reveal_answers(self):
+        if not self.round:
+            return {'result': IGNORED}
+        missed = [i for i in range(self.total_instances) if i not in self.instances_found]
+        if not self.learning_mode and missed:
+            self.incorrect_answers += len(missed)
+            self.calculate_score()
+        self._emit('reveal', len(missed))
+        feedback = {'missed': missed, 'message': None, 'speech': None, 'advance_after_ms': ANSWERS_ADVANCE_MS}
+        if missed:
+            feedback['message'] = f"You missed {len(missed)} {self.current_category}(s)"
+            feedback['speech'] = missed_text(len(missed))
+        if not self.learning_mode:
+            self.enter_learning_mode()
+        self.transitioning = True
+        return feedback
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+
+    def enter_learning_mode(self):
+        # Only reached from a scored round, which therefore counts as failed.
+        self._record_outcome(0.0)
+        self.learning_mode = True
+        self.repetitions_left = LEARNING_REPETITIONS
+        self.current_learning_category = self.current_category
+        self.current_word = self.current_category.capitalize()
+        self._emit('learning', self.repetitions_left)
+        if self.prefetcher is not None:
+            self.prefetcher.want(self.current_learning_category, self.repetitions_left)
+
+    def calculate_score(self):
+        if self.correct_answers == 0:
+            self.score = 0
+            return self.score
+        total_attempts = self.correct_answers + self.incorrect_answers
+        accuracy = (self.correct_answers / total_attempts) * 100
+        avg_time = self.response_times.mean
+        speed_bonus = max(0, 50 - min(50, avg_time * 5))
+        self.score = int(accuracy + speed_bonus)
+        return self.score
@@ -0,0 +1,125 @@
+import numpy as np
+
+# --------------------------
+# Segmentation hit masks
+# --------------------------
+# A round's instances are rasterized once, at display resolution, into a label
+# map where 0 is background and i+1 is instance i. A click is then one array
+# lookup instead of a scan over bounding boxes.
+
+
+def rle_counts(counts):
+    # Uncompressed RLE is already a list; compressed RLE uses COCO's string
+    # encoding (see rleFrString in pycocotools' maskApi.c).
+    if not isinstance(counts, (str, bytes)):
+        return [int(c) for c in counts]
+    if isinstance(counts, bytes):
+        counts = counts.decode('ascii')
+    decoded = []
+    p = 0
+    while p < len(counts):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(counts[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and (c & 0x10):
+                x |= -1 << (5 * k)
+        if len(decoded) > 2:
+            x += decoded[-2]
+        decoded.append(x)
+    return decoded
+
+
+def rasterize_polygon(coords, width, height):
+    # Even-odd scanline fill sampled at pixel centres: every edge is intersected
+    # with every row at once, and a running parity along each row marks the inside.
+    xs = np.asarray(coords[0::2], dtype=np.float64)
+    ys = np.asarray(coords[1::2], dtype=np.float64)
+    mask = np.zeros((height, width), dtype=bool)
+    if len(xs) < 3:
+        return mask
+    x0, y0 = xs, ys
+    x1, y1 = np.roll(xs, -1), np.roll(ys, -1)
+    rows = np.arange(height) + 0.5
+    crosses = (y0[:, None] <= rows) != (y1[:, None] <= rows)
+    edge, row = np.nonzero(crosses)
+    if not len(edge):
+        return mask
+    t = (rows[row] - y0[edge]) / (y1[edge] - y0[edge])
+    xi = x0[edge] + t * (x1[edge] - x0[edge])
+    cols = np.clip(np.floor(xi - 0.5).astype(np.int64) + 1, 0, width)
+    toggles = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(toggles, (row, cols), 1)
+    return (np.cumsum(toggles, axis=1)[:, :width] & 1).astype(bool)
+
+
+def decode_rle(counts, height, width):
+    counts = np.asarray(rle_counts(counts), dtype=np.int64)
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    flat = np.repeat(values, counts)
+    if len(flat) != height * width:
+        return None
+    # COCO RLE runs are column-major.
+    return flat.reshape(width, height).T
+
+
+def resize_nearest(mask, size):
+    height, width = mask.shape
+    rows = np.minimum(((np.arange(size[1]) + 0.5) * height / size[1]).astype(np.int64), height - 1)
+    cols = np.minimum(((np.arange(size[0]) + 0.5) * width / size[0]).astype(np.int64), width - 1)
+    return mask[rows[:, None], cols[None, :]]
+
+
+def instance_mask(segmentation, orig_size, display_size):
+    orig_width, orig_height = orig_size
+    if isinstance(segmentation, list) and segmentation:
+        scale_x = display_size[0] / orig_width
+        scale_y = display_size[1] / orig_height
+        mask = np.zeros((display_size[1], display_size[0]), dtype=bool)
+        for ring in segmentation:
+            ring = np.asarray(ring, dtype=np.float64).copy()
+            ring[0::2] *= scale_x
+            ring[1::2] *= scale_y
+            mask |= rasterize_polygon(ring, display_size[0], display_size[1])
+        return mask
+    if isinstance(segmentation, dict) and 'counts' in segmentation:
+        height, width = segmentation.get('size', (orig_height, orig_width))
+        mask = decode_rle(segmentation['counts'], height, width)
+        if mask is None:
+            return None
+        return resize_nearest(mask, display_size)
+    return None
+
+
+def bbox_mask(bbox, orig_size, display_size):
+    x1, y1, x2, y2 = bbox
+    scale_x = display_size[0] / orig_size[0]
+    scale_y = display_size[1] / orig_size[1]
+    mask = np.zeros((display_size[1], display_size[0]), dtype=bool)
+    mask[max(0, int(y1 * scale_y)):int(np.ceil(y2 * scale_y)) + 1,
+         max(0, int(x1 * scale_x)):int(np.ceil(x2 * scale_x)) + 1] = True
+    return mask
+
+
+def build_label_map(anns, bboxes, orig_size, display_size):
+    # Larger instances are painted first so a smaller object lying on top of a
+    # bigger one keeps its own pixels. Instances without a usable segmentation
+    # are painted as their bbox.
+    masks = []
+    for i, (ann, bbox) in enumerate(zip(anns, bboxes)):
+        mask = None
+        if ann is not None:
+            mask = instance_mask(ann.get('segmentation'), orig_size, display_size)
+        if mask is None or not mask.any():
+            mask = bbox_mask(bbox, orig_size, display_size)
+        masks.append((int(mask.sum()), i, mask))
+    label_map = np.zeros((display_size[1], display_size[0]), dtype=np.uint8)
+    for _, i, mask in sorted(masks, key=lambda m: -m[0]):
+        label_map[mask] = i + 1
+    return label_map
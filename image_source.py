@@ -0,0 +1,171 @@
+import io
+import os
+import struct
+import threading
+import zipfile
+import zlib
+from PIL import Image
+
+# --------------------------
+# Image sources
+# --------------------------
+# show_new_word asks a source for an image by COCO file name; it does not care
+# whether the JPEG lives in the extracted folder or inside val2017.zip.
+LOCAL_HEADER_FORMAT = '<4s2B4HL2L2H'
+LOCAL_HEADER_SIZE = struct.calcsize(LOCAL_HEADER_FORMAT)
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class DirectoryImageSource:
+    def __init__(self, images_dir):
+        self.images_dir = images_dir
+
+    def __contains__(self, file_name):
+        return os.path.exists(os.path.join(self.images_dir, file_name))
+
+    def read_bytes(self, file_name):
+        with open(os.path.join(self.images_dir, file_name), 'rb') as f:
+            return f.read()
+
+    def open(self, file_name):
+        return Image.open(os.path.join(self.images_dir, file_name))
+
+    def files(self):
+        # file name -> (size, change stamp); the stamp is the mtime here.
+        files = {}
+        with os.scandir(self.images_dir) as it:
+            for item in it:
+                if item.is_file():
+                    st = item.stat()
+                    files[item.name] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def close(self):
+        pass
+
+
+class ZipImageSource:
+    # The central directory is read once; members are then read with one
+    # positioned read on a per-thread file handle and inflated in memory, so
+    # worker threads never contend on a shared ZipFile.
+    def __init__(self, zip_path, fallback=None):
+        self.zip_path = zip_path
+        self.fallback = fallback
+        self._zip = zipfile.ZipFile(zip_path, 'r')
+        self._zip_lock = threading.Lock()
+        self.members = {}
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                self.members[os.path.basename(info.filename)] = info
+        self._data_offsets = {}
+        self._local = threading.local()
+        self._handles = []
+        self._handles_lock = threading.Lock()
+
+    def __contains__(self, file_name):
+        return file_name in self.members or (self.fallback is not None and file_name in self.fallback)
+
+    def _handle(self):
+        f = getattr(self._local, 'handle', None)
+        if f is None:
+            f = open(self.zip_path, 'rb')
+            self._local.handle = f
+            with self._handles_lock:
+                self._handles.append(f)
+        return f
+
+    def _data_offset(self, f, info):
+        offset = self._data_offsets.get(info.filename)
+        if offset is None:
+            f.seek(info.header_offset)
+            header = struct.unpack(LOCAL_HEADER_FORMAT, f.read(LOCAL_HEADER_SIZE))
+            if header[0] != LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+            name_len, extra_len = header[-2], header[-1]
+            offset = info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len
+            self._data_offsets[info.filename] = offset
+        return offset
+
+    def read_bytes(self, file_name):
+        info = self.members.get(file_name)
+        if info is None:
+            if self.fallback is not None:
+                return self.fallback.read_bytes(file_name)
+            raise KeyError(file_name)
+        if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            with self._zip_lock:
+                return self._zip.read(info)
+        f = self._handle()
+        f.seek(self._data_offset(f, info))
+        data = f.read(info.compress_size)
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompressobj(-15).decompress(data)
+        if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+            raise zipfile.BadZipFile(f"Corrupt member {info.filename}")
+        return data
+
+    def open(self, file_name):
+        if file_name not in self.members and self.fallback is not None:
+            return self.fallback.open(file_name)
+        return Image.open(io.BytesIO(self.read_bytes(file_name)))
+
+    def files(self):
+        # Members are stamped with their CRC, which changes with the content.
+        files = self.fallback.files() if self.fallback is not None else {}
+        for name, info in self.members.items():
+            files[name] = (info.file_size, info.CRC)
+        return files
+
+    def close(self):
+        with self._handles_lock:
+            for f in self._handles:
+                f.close()
+            self._handles = []
+        self._zip.close()
+
+
+class MultiImageSource:
+    # Serves a merged corpus (see ingest.py) whose file names are
+    # "<source>/<file name>" by handing the rest of the name to that source.
+    def __init__(self, sources):
+        self.sources = sources
+
+    def _route(self, file_name):
+        name, _, rest = file_name.partition('/')
+        source = self.sources.get(name)
+        if source is None:
+            raise KeyError(file_name)
+        return source, rest
+
+    def __contains__(self, file_name):
+        try:
+            source, rest = self._route(file_name)
+        except KeyError:
+            return False
+        return rest in source
+
+    def read_bytes(self, file_name):
+        source, rest = self._route(file_name)
+        return source.read_bytes(rest)
+
+    def open(self, file_name):
+        source, rest = self._route(file_name)
+        return source.open(rest)
+
+    def files(self):
+        return {f"{name}/{file_name}": stamp
+                for name, source in self.sources.items() for file_name, stamp in source.files().items()}
+
+    def close(self):
+        for source in self.sources.values():
+            source.close()
+
+
+def make_image_source(images_dir, zip_path):
+    fallback = DirectoryImageSource(images_dir) if os.path.isdir(images_dir) else None
+    if os.path.exists(zip_path):
+        try:
+            return ZipImageSource(zip_path, fallback)
+        except zipfile.BadZipFile:
+            pass
+    return fallback
@@ -0,0 +1,413 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from array import array
+import numpy as np
+from annotation_store import (
+    STORE_VERSION, AnnotationStore, ChunkedArray, assemble_store_arrays, category_index,
+    read_store_header, segmentation_columns, write_store
+)
+from round_index import source_signature
+
+# --------------------------
+# Streaming corpus ingestion
+# --------------------------
+# Builds one annotation store from several instance files (COCO train/val,
+# LVIS, custom sets) without ever holding a parsed file in memory. Each source
+# is streamed into its own part store, which is only rebuilt when its file
+# changes; the parts are then merged into corpus.store. In the merged store
+# image file names are "<source>/<file name>" (see MultiImageSource), image and
+# annotation ids are offset by a slot number the source keeps for good (see
+# slots.json), and categories are matched across sources by name. Slot 0 is
+# never handed out, so merged ids cannot collide with plain val2017 ones.
+READ_SIZE = 1 << 20
+SPILL_ITEMS = 1 << 20
+MERGE_SLICE = 1 << 22
+ID_SHIFT_BITS = 40
+# Part stores are rebuilt when this changes, as well as when their file does.
+PART_VERSION = 2
+RAGGED_COLUMNS = [('seg_ring_lengths', 'i', np.int32), ('seg_coords', 'f', np.float32),
+                  ('seg_rle_counts', 'i', np.int32)]
+_WHITESPACE = ' \t\n\r'
+
+
+class JsonStream:
+    # Just enough of an incremental JSON reader for instance files: the top-level
+    # object is walked by hand and every element of a top-level array is decoded
+    # on its own with raw_decode, so only one element is ever materialised.
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.consumed = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.consumed += len(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def take(self, expected):
+        c = self.peek()
+        if c not in expected:
+            raise ValueError(f"Expected one of {expected!r} but found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number that ends the buffer may continue in the next read.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return value
+
+
+def iter_top_level_items(f):
+    # Yields (key, element, characters read so far) for every element of every
+    # top-level array; other top-level values are decoded and dropped.
+    stream = JsonStream(f)
+    stream.take('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.take(':')
+        if stream.peek() == '[':
+            stream.take('[')
+            if stream.peek() == ']':
+                stream.take(']')
+            else:
+                while True:
+                    yield key, stream.value(), stream.consumed
+                    if stream.take(',]') == ']':
+                        break
+        else:
+            stream.value()
+        if stream.take(',}') == '}':
+            return
+
+
+class SpillColumn:
+    # A ragged column built row by row: lengths stay in memory, values are
+    # appended to a file whenever the buffer grows past SPILL_ITEMS.
+    def __init__(self, path, typecode, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.lengths = array('q')
+        self.buffer = array(typecode)
+        self.count = 0
+        self.file = open(path, 'wb')
+
+    def add(self, values):
+        self.lengths.append(len(values))
+        self.buffer.extend(values)
+        if len(self.buffer) >= SPILL_ITEMS:
+            self._spill()
+
+    def _spill(self):
+        self.count += len(self.buffer)
+        self.buffer.tofile(self.file)
+        del self.buffer[:]
+
+    def finish(self):
+        self._spill()
+        self.file.close()
+        lengths = np.frombuffer(self.lengths, dtype=np.int64)
+        if not self.count:
+            return lengths, np.memmap(self.path, dtype=self.dtype, mode='w+', shape=(1,))[:0]
+        return lengths, np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.count,))
+
+
+def image_file_name(image):
+    # LVIS images carry no file_name, only the COCO URL they were taken from.
+    # They come from both COCO splits, so the URL's folder is kept as well:
+    # "train2017/000000000009.jpg", served by the source's "splits".
+    if 'file_name' in image:
+        return image['file_name']
+    return '/'.join((image.get('coco_url') or image['flickr_url']).rsplit('/', 2)[-2:])
+
+
+def normalize_category(name):
+    return ' '.join(name.replace('_', ' ').lower().split())
+
+
+def ingest_source(source, part_path, signature, progress=None):
+    prefix = f"{source['name']}/".encode('utf-8')
+    img_ids, img_width, img_height = array('q'), array('i'), array('i')
+    name_lengths, names = array('q'), bytearray()
+    ann_ids, ann_img_ids, ann_cat_ids = array('q'), array('q'), array('i')
+    ann_bboxes, ann_area, ann_iscrowd = array('f'), array('f'), array('B')
+    categories = []
+    total = os.path.getsize(source['annotations'])
+    spill_dir = tempfile.mkdtemp(prefix='ingest-', dir=os.path.dirname(part_path) or '.')
+    try:
+        spills = [SpillColumn(os.path.join(spill_dir, name), typecode, dtype)
+                  for name, typecode, dtype in RAGGED_COLUMNS]
+        with open(source['annotations'], 'r', encoding='utf-8') as f:
+            for n, (key, item, consumed) in enumerate(iter_top_level_items(f)):
+                if key == 'annotations':
+                    ann_ids.append(item['id'])
+                    ann_img_ids.append(item['image_id'])
+                    ann_cat_ids.append(item['category_id'])
+                    ann_bboxes.extend(item['bbox'])
+                    ann_area.append(item.get('area', 0))
+                    ann_iscrowd.append(item.get('iscrowd', 0))
+                    for spill, values in zip(spills, segmentation_columns(item.get('segmentation'))):
+                        spill.add(values)
+                elif key == 'images':
+                    img_ids.append(item['id'])
+                    img_width.append(item.get('width', 0))
+                    img_height.append(item.get('height', 0))
+                    name = prefix + image_file_name(item).encode('utf-8')
+                    name_lengths.append(len(name))
+                    names += name
+                elif key == 'categories':
+                    categories.append({'id': item['id'], 'name': item['name'],
+                                       'supercategory': item.get('supercategory', '')})
+                if progress and n % 100000 == 0:
+                    progress(source['name'], min(consumed, total), total)
+        if progress:
+            progress(source['name'], total, total)
+        ragged = {name: spill.finish() for (name, _, _), spill in zip(RAGGED_COLUMNS, spills)}
+
+        img_ids = np.frombuffer(img_ids, dtype=np.int64)
+        ann_ids = np.frombuffer(ann_ids, dtype=np.int64)
+        if (len(img_ids) and img_ids.max() >> ID_SHIFT_BITS) or (len(ann_ids) and ann_ids.max() >> ID_SHIFT_BITS):
+            raise ValueError(f"{source['annotations']}: ids must be below 2**{ID_SHIFT_BITS}")
+        img_order = np.argsort(img_ids, kind='stable')
+        name_lengths = np.frombuffer(name_lengths, dtype=np.int64)
+        name_starts = np.concatenate([[0], np.cumsum(name_lengths)[:-1]]).astype(np.int64)
+        img_name_offsets = np.zeros(len(img_ids) + 1, dtype=np.int64)
+        np.cumsum(name_lengths[img_order], out=img_name_offsets[1:])
+        gather = (np.repeat(name_starts[img_order] - img_name_offsets[:-1], name_lengths[img_order])
+                  + np.arange(img_name_offsets[-1]))
+        img_names = np.frombuffer(bytes(names), dtype=np.uint8)[gather]
+        img_ids = img_ids[img_order]
+
+        ann_img_ids = np.frombuffer(ann_img_ids, dtype=np.int64)
+        ann_cat_ids = np.frombuffer(ann_cat_ids, dtype=np.int32)
+        cat_ids = np.array(sorted(cat['id'] for cat in categories), dtype=np.int32)
+        # Annotations pointing at images or categories the file does not define are dropped.
+        keep = np.isin(ann_img_ids, img_ids) & np.isin(ann_cat_ids, cat_ids)
+        arrays = assemble_store_arrays(
+            img_ids, np.frombuffer(img_width, dtype=np.int32)[img_order],
+            np.frombuffer(img_height, dtype=np.int32)[img_order], img_name_offsets, img_names,
+            ann_ids, ann_img_ids, ann_cat_ids, np.frombuffer(ann_bboxes, dtype=np.float32).reshape(-1, 4),
+            np.frombuffer(ann_area, dtype=np.float32), np.frombuffer(ann_iscrowd, dtype=np.uint8),
+            categories, ragged, keep
+        )
+        write_store(part_path, arrays, categories, signature)
+        del arrays, ragged
+        return {'images': len(img_ids), 'annotations': int(keep.sum()), 'dropped': int(len(keep) - keep.sum()),
+                'categories': len(categories)}
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def _sliced(parts):
+    def chunks():
+        for part in parts:
+            for i in range(0, len(part), MERGE_SLICE):
+                yield part[i:i + MERGE_SLICE]
+    return chunks
+
+
+def merge_parts(parts, merged_path, manifest):
+    # parts: (slot, part store path). Slots are merged in increasing order.
+    parts = sorted(parts)
+    stores = [AnnotationStore(path) for _, path in parts]
+    try:
+        merged_cats = {}
+        for store in stores:
+            for cat_id in store.cat_ids:
+                cat = store.cats[int(cat_id)]
+                merged_cats.setdefault(normalize_category(cat['name']), cat.get('supercategory', ''))
+        names = sorted(merged_cats)
+        categories = [{'id': i + 1, 'name': name, 'supercategory': merged_cats[name]}
+                      for i, name in enumerate(names)]
+        merged_ids = {name: i + 1 for i, name in enumerate(names)}
+
+        columns = {name: [] for name in (
+            'img_ids', 'img_width', 'img_height', 'img_name_offsets', 'img_names', 'img_ann_offsets',
+            'ann_ids', 'ann_img_ids', 'ann_cat_ids', 'ann_bboxes', 'ann_area', 'ann_iscrowd', 'ann_id_order')}
+        ragged_offsets = {name: [] for name, _, _ in RAGGED_COLUMNS}
+        name_base = ann_base = 0
+        ragged_base = dict.fromkeys(ragged_offsets, 0)
+        for (slot, _), store in zip(parts, stores):
+            # Shifted ids keep every part's id order, so the parts' own sort
+            # orders concatenate into a valid order for the merged store.
+            shift = slot << ID_SHIFT_BITS
+            cat_map = np.array([merged_ids[normalize_category(store.cats[int(c)]['name'])] for c in store.cat_ids],
+                               dtype=np.int32)
+            columns['img_ids'].append(store.img_ids + shift)
+            columns['img_width'].append(store.img_width)
+            columns['img_height'].append(store.img_height)
+            columns['img_name_offsets'].append(store.img_name_offsets[:-1] + name_base)
+            columns['img_names'].append(store.img_names)
+            columns['img_ann_offsets'].append(store.img_ann_offsets[:-1] + ann_base)
+            columns['ann_ids'].append(store.ann_ids + shift)
+            columns['ann_img_ids'].append(store.ann_img_ids + shift)
+            columns['ann_cat_ids'].append(cat_map[np.searchsorted(store.cat_ids, store.ann_cat_ids)])
+            columns['ann_bboxes'].append(store.ann_bboxes)
+            columns['ann_area'].append(store.ann_area)
+            columns['ann_iscrowd'].append(store.ann_iscrowd)
+            columns['ann_id_order'].append(store.ann_id_order + ann_base)
+            for name in ragged_offsets:
+                offsets = getattr(store, f'{name}_offsets')
+                ragged_offsets[name].append(offsets[:-1] + ragged_base[name])
+                ragged_base[name] += int(offsets[-1])
+            name_base += int(store.img_name_offsets[-1])
+            ann_base += len(store.ann_ids)
+
+        arrays = {name: np.concatenate(parts) for name, parts in columns.items()}
+        arrays['img_name_offsets'] = np.append(arrays['img_name_offsets'], name_base)
+        arrays['img_ann_offsets'] = np.append(arrays['img_ann_offsets'], ann_base)
+        arrays['ann_sorted_ids'] = arrays['ann_ids'][arrays['ann_id_order']]
+        arrays.update(category_index(arrays['ann_cat_ids'], arrays['ann_img_ids'],
+                                     np.arange(1, len(categories) + 1, dtype=np.int32)))
+        for name, _, dtype in RAGGED_COLUMNS:
+            arrays[f'{name}_offsets'] = np.append(np.concatenate(ragged_offsets[name]), ragged_base[name])
+            arrays[name] = ChunkedArray(dtype, (ragged_base[name],), _sliced([getattr(s, name) for s in stores]))
+        write_store(merged_path, arrays, categories, manifest)
+        images = len(arrays['img_ids'])
+        del arrays, columns
+        return {'images': images, 'annotations': ann_base, 'categories': len(categories)}
+    finally:
+        for store in stores:
+            store.close()
+
+
+def _fresh(store_path, signature):
+    try:
+        header = read_store_header(store_path)
+    except (OSError, ValueError):
+        return False
+    return header.get('version') == STORE_VERSION and header.get('source') == signature
+
+
+def load_sources(sources_file):
+    # A JSON list of {"name", "annotations", "images", "zip"}; relative paths are
+    # taken relative to the list file. A source whose images are spread over
+    # folders (LVIS) gives "splits": {"train2017": {"images", "zip"}, ...} instead.
+    with open(sources_file, 'r') as f:
+        sources = json.load(f)
+    base = os.path.dirname(os.path.abspath(sources_file))
+    seen = set()
+    for source in sources:
+        name = source.get('name', '')
+        if not name or '/' in name or '\\' in name or name in seen:
+            raise ValueError(f"{sources_file}: source names must be unique and contain no slashes ({name!r})")
+        seen.add(name)
+        for entry in [source] + list((source.get('splits') or {}).values()):
+            for key in ('annotations', 'images', 'zip'):
+                if entry.get(key):
+                    entry[key] = os.path.join(base, entry[key])
+    if not sources:
+        raise ValueError(f"{sources_file}: no sources")
+    return sources
+
+
+def load_slots(slots_path, names):
+    # Source name -> slot. Ids, and so thumbnails keyed by id, stay the same
+    # when sources are reordered, added or removed; slots are never reused.
+    try:
+        with open(slots_path, 'r') as f:
+            slots = json.load(f)
+    except (OSError, ValueError):
+        slots = {}
+    next_slot = max(slots.values(), default=0) + 1
+    added = False
+    for name in names:
+        if name not in slots:
+            if next_slot >> (63 - ID_SHIFT_BITS):
+                raise ValueError(f"{slots_path}: out of source slots")
+            slots[name] = next_slot
+            next_slot += 1
+            added = True
+    if added:
+        tmp_path = slots_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(slots, f, indent=1)
+        os.replace(tmp_path, slots_path)
+    return slots
+
+
+def ingest_corpus(sources, corpus_dir, progress=None):
+    # Returns the merged store path; only sources whose file changed since the
+    # last run are parsed again, and the merge is skipped when nothing changed.
+    parts_dir = os.path.join(corpus_dir, 'parts')
+    os.makedirs(parts_dir, exist_ok=True)
+    slots = load_slots(os.path.join(corpus_dir, 'slots.json'), [source['name'] for source in sources])
+    parts = []
+    manifest = {'parts': []}
+    stats = {}
+    for source in sources:
+        part_path = os.path.join(parts_dir, f"{source['name']}.store")
+        signature = dict(source_signature(source['annotations']), part_version=PART_VERSION)
+        if not _fresh(part_path, signature):
+            stats[source['name']] = ingest_source(source, part_path, signature, progress)
+        slot = slots[source['name']]
+        parts.append((slot, part_path))
+        manifest['parts'].append([source['name'], slot, signature])
+    # Only the set of sources matters, not the order they are listed in.
+    manifest['parts'].sort(key=lambda part: part[1])
+    merged_path = os.path.join(corpus_dir, 'corpus.store')
+    if not _fresh(merged_path, manifest):
+        stats['corpus'] = merge_parts(parts, merged_path, manifest)
+    return merged_path, stats
+
+
+def main():
+    from benchmark import peak_rss_mb
+    parser = argparse.ArgumentParser(description="Stream several instance files into one merged annotation store.")
+    parser.add_argument('sources', help="JSON list of {name, annotations, images, zip}")
+    parser.add_argument('--corpus-dir', help="Where part stores and corpus.store live (default: the game's)")
+    args = parser.parse_args()
+    corpus_dir = args.corpus_dir
+    if corpus_dir is None:
+        import dataset
+        corpus_dir = dataset.CORPUS_DIR
+
+    def progress(name, done, total):
+        print(f"Ingesting {name}... {done / total if total else 1:.0%}", end='\r' if done < total else '\n')
+
+    started = time.perf_counter()
+    merged_path, stats = ingest_corpus(load_sources(args.sources), corpus_dir, progress)
+    for name, summary in stats.items():
+        print(f"{name}: " + ", ".join(f"{value} {key}" for key, value in summary.items()))
+    if not stats:
+        print("All sources unchanged.")
+    rss = peak_rss_mb()
+    print(f"Wrote {merged_path} in {time.perf_counter() - started:.1f} s"
+          + (f" (peak RSS {rss:.0f} MB)" if rss is not None else ""))
+
+
+if __name__ == '__main__':
+    main()
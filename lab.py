@@ -0,0 +1,351 @@
+import argparse
+import collections
+import json
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from latency import span
+from thumbnail_cache import decode_thumbnail
+
+# --------------------------
+# Lab mode: one dataset, many windows
+# --------------------------
+# On a shared kiosk every child gets their own game window in their own
+# process, so one crash leaves the others playing. The supervisor does the
+# heavy loading once: it converts the annotations, builds every level's round
+# index and decodes a pool of display-size thumbnails into one file. Children
+# memory-map that pool and the annotation store read-only, so the page cache
+# holds a single copy and each window only adds its interpreter, Tk and mixer.
+# Known gap: the round indexes are still JSON that every child parses into its
+# own lists, a few MB per window on val2017.
+POOL_MAGIC = b'FIPOOL01'
+POOL_VERSION = 1
+ALIGNMENT = 64
+DEFAULT_POOL_MAX_BYTES = 512 * 1024 * 1024
+# RGBX rather than RGB: Pillow only maps 4-byte modes onto a buffer without copying.
+FRAME_MODE = 'RGBX'
+FRAME_CHANNELS = 4
+WINDOW_WIDTH, WINDOW_HEIGHT = 500, 700
+WINDOW_GAP = 10
+RESTART_DELAY = 2.0
+MAX_RESTARTS = 5
+RESTART_WINDOW = 60.0
+
+
+def pool_data_start(header_len):
+    return -(-(len(POOL_MAGIC) + 8 + header_len) // ALIGNMENT) * ALIGNMENT
+
+
+def read_pool_header(pool_path):
+    with open(pool_path, 'rb') as f:
+        if f.read(len(POOL_MAGIC)) != POOL_MAGIC:
+            raise ValueError(f"{pool_path} is not a thumbnail pool")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('version') != POOL_VERSION:
+        raise ValueError(f"{pool_path} has unsupported version {header.get('version')}")
+    header['data_start'] = pool_data_start(header_len)
+    return header
+
+
+def build_pool(pool_path, entries, image_source, size, source=None, workers=None, progress=None):
+    # entries: (image_id, file_name) in priority order. Frames are raw pixels at
+    # `size`, one per slot, so a reader can hand out views without decoding.
+    os.makedirs(os.path.dirname(pool_path) or '.', exist_ok=True)
+    blob_path = pool_path + '.data.tmp'
+    image_ids = []
+
+    def decode(entry):
+        try:
+            img = decode_thumbnail(image_source.open(entry[1]), size, Image.Resampling.LANCZOS)
+            return img.convert(FRAME_MODE).tobytes()
+        except Exception:
+            return None
+
+    with open(blob_path, 'wb') as f:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for done, (entry, frame) in enumerate(zip(entries, pool.map(decode, entries)), 1):
+                if frame is not None:
+                    f.write(frame)
+                    image_ids.append(entry[0])
+                if progress:
+                    progress(done, len(entries))
+    header = {'version': POOL_VERSION, 'source': source, 'size': list(size), 'mode': FRAME_MODE,
+              'image_ids': image_ids}
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    tmp_path = pool_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(POOL_MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            f.seek(pool_data_start(len(header_bytes)))
+            with open(blob_path, 'rb') as blob:
+                shutil.copyfileobj(blob, f, 1024 * 1024)
+        os.replace(tmp_path, pool_path)
+    finally:
+        os.remove(blob_path)
+    return {'frames': len(image_ids), 'failed': len(entries) - len(image_ids), 'bytes': os.path.getsize(pool_path)}
+
+
+class SharedThumbnailPool:
+    # Read-only view of a pool file with the ThumbnailCache interface. Hits are
+    # zero-copy images over the shared mapping; misses go to `fallback` (the
+    # usual per-process disk cache) or are decoded directly.
+    def __init__(self, pool_path, fallback=None):
+        self.pool_path = pool_path
+        self.fallback = fallback
+        header = read_pool_header(pool_path)
+        self.size = tuple(header['size'])
+        self.data_start = header['data_start']
+        self.frame_bytes = self.size[0] * self.size[1] * FRAME_CHANNELS
+        self.slots = {image_id: i for i, image_id in enumerate(header['image_ids'])}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._file = open(pool_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.slots),
+                'bytes': len(self.slots) * self.frame_bytes,
+            }
+        if self.fallback is not None:
+            stats['fallback'] = self.fallback.stats()
+        return stats
+
+    def get(self, image_id, load, size, resample=Image.Resampling.LANCZOS):
+        slot = self.slots.get(image_id) if tuple(size) == self.size else None
+        if slot is None:
+            with self.lock:
+                self.misses += 1
+            if self.fallback is not None:
+                return self.fallback.get(image_id, load, size, resample)
+            return decode_thumbnail(load(), size, resample)
+        with span('thumbnail.shared'):
+            start = self.data_start + slot * self.frame_bytes
+            img = Image.frombuffer(FRAME_MODE, self.size, self._view[start:start + self.frame_bytes],
+                                   'raw', FRAME_MODE, 0, 1)
+        with self.lock:
+            self.hits += 1
+        return img
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+def pool_entries(round_indexes, max_frames):
+    # Images that appear in the most rounds across all levels come first.
+    counts = collections.Counter()
+    names = {}
+    for round_index in round_indexes:
+        for rounds in round_index.entries.values():
+            for img_id, file_name, *_ in rounds:
+                counts[img_id] += 1
+                names[img_id] = file_name
+    ranked = sorted(counts, key=lambda img_id: (-counts[img_id], img_id))[:max_frames]
+    return [(img_id, names[img_id]) for img_id in ranked]
+
+
+def memory_usage(pid):
+    # Proportional set size splits shared pages between the processes mapping
+    # them, so it is the honest per-window cost. Linux only.
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return None
+    return usage
+
+
+class Window:
+    def __init__(self, learner, position):
+        self.learner = learner
+        self.position = position
+        self.process = None
+        self.restarts = collections.deque()
+
+
+class LabSupervisor:
+    # Starts one game process per learner and restarts any that crash, up to
+    # MAX_RESTARTS within RESTART_WINDOW seconds. A window the child closes
+    # normally stays closed.
+    def __init__(self, learners, pool_path, columns, restart=True):
+        self.pool_path = pool_path
+        self.restart = restart
+        self.windows = []
+        for i, learner in enumerate(learners):
+            row, col = divmod(i, columns)
+            position = f"+{col * (WINDOW_WIDTH + WINDOW_GAP)}+{row * (WINDOW_HEIGHT + WINDOW_GAP)}"
+            self.windows.append(Window(learner, position))
+
+    def launch(self, window):
+        env = dict(os.environ, FIND_ITEMS_LEARNER=window.learner, FIND_ITEMS_LAB_POOL=self.pool_path,
+                   FIND_ITEMS_WINDOW_POS=window.position)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'find_items.py')
+        window.process = subprocess.Popen([sys.executable, script], env=env)
+        print(f"Started window for {window.learner} (pid {window.process.pid})")
+
+    def run(self, report_interval=None):
+        for window in self.windows:
+            self.launch(window)
+        last_report = time.monotonic()
+        try:
+            while any(window.process is not None for window in self.windows):
+                time.sleep(0.5)
+                now = time.monotonic()
+                for window in self.windows:
+                    if window.process is None or window.process.poll() is None:
+                        continue
+                    code = window.process.returncode
+                    window.process = None
+                    if code == 0 or not self.restart:
+                        print(f"Window for {window.learner} closed (exit {code})")
+                        continue
+                    while window.restarts and now - window.restarts[0] > RESTART_WINDOW:
+                        window.restarts.popleft()
+                    if len(window.restarts) >= MAX_RESTARTS:
+                        print(f"Window for {window.learner} keeps crashing (exit {code}); giving up")
+                        continue
+                    window.restarts.append(now)
+                    print(f"Window for {window.learner} crashed (exit {code}); restarting")
+                    time.sleep(RESTART_DELAY)
+                    self.launch(window)
+                if report_interval and now - last_report >= report_interval:
+                    last_report = now
+                    self.report()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def report(self):
+        for window in self.windows:
+            if window.process is None:
+                continue
+            usage = memory_usage(window.process.pid)
+            if usage:
+                print(f"  {window.learner:<12} pid {window.process.pid:<7} rss {usage.get('Rss', 0):7.1f} MB  "
+                      f"pss {usage.get('Pss', 0):7.1f} MB")
+
+    def stop(self):
+        for window in self.windows:
+            if window.process is not None and window.process.poll() is None:
+                window.process.terminate()
+        for window in self.windows:
+            if window.process is not None:
+                try:
+                    window.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    window.process.kill()
+
+
+def prepare(pool_path, max_bytes, workers=None, progress=print):
+    # The shared part of every window's startup, done once by the supervisor.
+    import dataset
+    from game_engine import DISPLAY_SIZE, FEEDBACK_PHRASES, LEVELS, prompt_text
+    from round_index import source_signature
+    from verify import load_manifest, manifest_digest
+    from audio_cache import AudioCache, make_engines
+    progress("Checking dataset...")
+    dataset.ensure_dataset_available()
+    progress("Loading annotations...")
+    dataset.coco = dataset.load_annotations()
+    if dataset.coco is None:
+        raise RuntimeError("Could not load the COCO dataset.")
+    progress("Verifying images...")
+    try:
+        from verify import verify_images
+        stats = verify_images(dataset.image_manifest_file(), dataset.open_image_source, workers)
+        print(f"{stats['checked']} images checked, {stats['quarantined']} quarantined")
+    except FileNotFoundError:
+        pass
+    dataset.load_quarantine()
+    round_indexes = []
+    for level in LEVELS:
+        progress(f"Preparing level {level}...")
+        round_indexes.append(dataset.get_round_index(level, dataset.MIN_BBOX_SIZE,
+                                                     dataset.MIN_MULTI_INSTANCE_SIZE, dataset.MAX_SMALL_INSTANCES))
+    annotation_file, _ = dataset.round_index_files()
+    # Frames are served without any further check, so a changed or newly
+    # quarantined image must rebuild the pool.
+    source = {'annotations': source_signature(annotation_file),
+              'images': manifest_digest(load_manifest(dataset.image_manifest_file())), 'max_bytes': max_bytes}
+    size = tuple(DISPLAY_SIZE)
+    try:
+        header = read_pool_header(pool_path)
+        stale = header.get('source') != source or tuple(header['size']) != size or header.get('mode') != FRAME_MODE
+    except (OSError, ValueError):
+        stale = True
+    if stale:
+        entries = pool_entries(round_indexes, max_bytes // (size[0] * size[1] * FRAME_CHANNELS))
+        image_source = dataset.open_image_source()
+
+        def pool_progress(done, total):
+            if done == total or done % 100 == 0:
+                print(f"Decoded {done}/{total} thumbnails", end='\r' if done < total else '\n')
+
+        stats = build_pool(pool_path, entries, image_source, size, source, workers, pool_progress)
+        print(f"Shared pool: {stats['frames']} frames ({stats['failed']} failed), {stats['bytes'] / 1e6:.1f} MB")
+        if image_source is not None:
+            image_source.close()
+    progress("Preparing voices...")
+    try:
+        cache = AudioCache(dataset.AUDIO_CACHE_DIR, make_engines(dataset.AUDIO_ENGINES),
+                           dataset.AUDIO_CACHE_MAX_BYTES, dataset.AUDIO_LANG)
+        names = [cat['name'] for cat in dataset.coco.loadCats(dataset.coco.getCatIds())]
+        cache.prewarm(FEEDBACK_PHRASES + [prompt_text(name) for name in names])
+    except Exception:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several game windows, one process per child, "
+                                                 "sharing one memory-mapped dataset.")
+    parser.add_argument('learners', nargs='*', help="One window per learner name")
+    parser.add_argument('--windows', type=int, help="Number of windows when no names are given")
+    parser.add_argument('--columns', type=int, default=3, help="Windows per row on screen")
+    parser.add_argument('--pool', help="Shared thumbnail pool file (default: under the dataset directory)")
+    parser.add_argument('--pool-mb', type=int, default=DEFAULT_POOL_MAX_BYTES // (1024 * 1024))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--no-restart', action='store_true', help="Do not restart crashed windows")
+    parser.add_argument('--report-interval', type=float, default=0.0,
+                        help="Print per-window memory use every N seconds")
+    args = parser.parse_args()
+    learners = args.learners or [f"child{i + 1}" for i in range(args.windows or 2)]
+    if len(set(learners)) != len(learners):
+        parser.error("learner names must be unique")
+    import dataset
+    pool_path = args.pool or os.path.join(dataset.DATASET_DIR, 'lab', 'thumbnails.pool')
+    prepare(pool_path, args.pool_mb * 1024 * 1024, args.workers)
+    LabSupervisor(learners, pool_path, max(1, args.columns), not args.no_restart).run(args.report_interval)
+
+
+if __name__ == '__main__':
+    main()
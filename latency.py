@@ -0,0 +1,159 @@
+import csv
+import json
+import math
+import os
+import threading
+import time
+
+# --------------------------
+# Stage latency histograms
+# --------------------------
+# Named spans feed fixed log-scale histograms (four buckets per doubling, from
+# 1 us up), so recording is O(1) with no per-sample storage and percentiles are
+# accurate to about 19%. Spans may be recorded from any thread.
+MIN_SECONDS = 1e-6
+BUCKETS_PER_OCTAVE = 4
+NUM_BUCKETS = 112
+CSV_FIELDS = ['stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'min_ms', 'max_ms']
+
+
+def bucket_index(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+    return min(NUM_BUCKETS - 1, int(math.log2(seconds / MIN_SECONDS) * BUCKETS_PER_OCTAVE))
+
+
+def bucket_upper(index):
+    return MIN_SECONDS * 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bucket_index(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(max(bucket_upper(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': 1000 * self.total / self.count if self.count else 0.0,
+            'p50_ms': 1000 * self.percentile(50),
+            'p95_ms': 1000 * self.percentile(95),
+            'p99_ms': 1000 * self.percentile(99),
+            'min_ms': 1000 * self.min if self.count else 0.0,
+            'max_ms': 1000 * self.max,
+        }
+
+
+class Span:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Timings:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def export_json(self, path):
+        with self.lock:
+            data = {
+                'bucket_min_seconds': MIN_SECONDS,
+                'buckets_per_octave': BUCKETS_PER_OCTAVE,
+                'stages': {
+                    name: dict(histogram.summary(), buckets=histogram.counts[:])
+                    for name, histogram in sorted(self.histograms.items())
+                },
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def export_csv(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for name, summary in self.snapshot().items():
+                writer.writerow(dict(summary, stage=name))
+        os.replace(tmp_path, path)
+
+
+# Process-wide recorder shared by the game, the engine and the caches.
+timings = Timings()
+
+
+def span(name):
+    return timings.span(name)
+
+
+def record(name, seconds):
+    timings.record(name, seconds)
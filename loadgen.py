@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+import urllib.parse
+from benchmark import percentile
+
+# --------------------------
+# Round server load generator
+# --------------------------
+# Simulates a room full of kids against server.py: every virtual client holds
+# one keep-alive connection, starts a session and plays rounds (fetch round,
+# fetch image, click until done) for the given duration. Run the server with
+# --click-debounce-ms 0 when think time is 0, or quick clicks will be ignored.
+DEFAULT_URL = 'http://127.0.0.1:8765'
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n"
+        )
+        self.writer.write(head.encode('latin-1') + data)
+        await self.writer.drain()
+        status_line, _, header_block = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').partition('\r\n')
+        status = int(status_line.split(' ', 2)[1])
+        headers = {}
+        for line in header_block.split('\r\n'):
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        payload = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers, payload
+
+    async def json(self, method, path, body=None):
+        status, _, payload = await self.request(method, path, body)
+        if status != 200:
+            raise RuntimeError(f"{method} {path} -> {status}: {payload[:200]!r}")
+        return json.loads(payload)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.rounds = 0
+        self.completed = 0
+        self.ignored = 0
+        self.errors = 0
+
+    def timed(self, name, start):
+        self.latencies[name].append(time.perf_counter() - start)
+
+
+async def play(client_id, host, port, level, deadline, stats, think, miss_rate):
+    rng = random.Random(client_id)
+    conn = Connection(host, port)
+    try:
+        start = time.perf_counter()
+        session_id = (await conn.json('POST', '/sessions', {'level': level}))['session']
+        stats.timed('create', start)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            info = await conn.json('POST', f"/sessions/{session_id}/next")
+            stats.timed('next', start)
+            stats.rounds += 1
+            if 'error' in info:
+                continue
+            start = time.perf_counter()
+            status, _, _ = await conn.request('GET', info['image_url'])
+            stats.timed('image', start)
+            if status != 200:
+                stats.errors += 1
+            found = set()
+            width, height = info['display_size']
+            scale_x, scale_y = info['scale']
+            complete = False
+            for _ in range(4 * len(info['bboxes']) + 8):
+                if think:
+                    await asyncio.sleep(think)
+                if rng.random() < miss_rate:
+                    x, y = rng.randrange(width), rng.randrange(height)
+                else:
+                    i = rng.choice([i for i in range(len(info['bboxes'])) if i not in found] or [0])
+                    x1, y1, x2, y2 = info['bboxes'][i]
+                    x, y = int((x1 + x2) / 2 * scale_x), int((y1 + y2) / 2 * scale_y)
+                start = time.perf_counter()
+                feedback = await conn.json('POST', f"/sessions/{session_id}/click", {'x': x, 'y': y})
+                stats.timed('click', start)
+                if feedback['result'] == 'ignored':
+                    stats.ignored += 1
+                elif feedback['result'] in ('found', 'complete'):
+                    found.add(feedback['instance'])
+                if feedback['result'] == 'complete':
+                    complete = True
+                    break
+            if complete:
+                stats.completed += 1
+            else:
+                start = time.perf_counter()
+                await conn.json('POST', f"/sessions/{session_id}/answers")
+                stats.timed('answers', start)
+        await conn.json('DELETE', f"/sessions/{session_id}")
+    except (OSError, RuntimeError, asyncio.IncompleteReadError, ValueError):
+        stats.errors += 1
+    finally:
+        conn.close()
+
+
+async def run(url, clients, duration, level, think, miss_rate, ramp):
+    parsed = urllib.parse.urlsplit(url)
+    host, port = parsed.hostname, parsed.port or 80
+    stats = LoadStats()
+    started = time.perf_counter()
+    deadline = started + duration
+    tasks = []
+    for client_id in range(clients):
+        tasks.append(asyncio.create_task(play(client_id, host, port, level, deadline, stats, think, miss_rate)))
+        if ramp:
+            await asyncio.sleep(ramp / clients)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    requests = sum(len(samples) for samples in stats.latencies.values())
+    return {
+        'clients': clients,
+        'elapsed_s': elapsed,
+        'requests': requests,
+        'requests_per_s': requests / elapsed,
+        'rounds': stats.rounds,
+        'rounds_per_s': stats.rounds / elapsed,
+        'completed': stats.completed,
+        'ignored_clicks': stats.ignored,
+        'errors': stats.errors,
+        'latency_ms': {
+            name: {
+                'count': len(samples),
+                'p50': 1000 * percentile(samples, 50),
+                'p99': 1000 * percentile(samples, 99),
+            }
+            for name, samples in sorted(stats.latencies.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive many concurrent sessions against server.py.")
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds to play")
+    parser.add_argument('--level', type=int, default=2)
+    parser.add_argument('--think-ms', type=float, default=0.0, help="Pause before each click")
+    parser.add_argument('--miss-rate', type=float, default=0.2)
+    parser.add_argument('--ramp', type=float, default=1.0, help="Seconds over which clients connect")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+    report = asyncio.run(run(args.url, args.clients, args.duration, args.level,
+                             args.think_ms / 1000, args.miss_rate, args.ramp))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"clients:      {report['clients']}")
+    print(f"requests/sec: {report['requests_per_s']:.1f} ({report['requests']} in {report['elapsed_s']:.1f} s)")
+    print(f"rounds/sec:   {report['rounds_per_s']:.1f} ({report['completed']} completed)")
+    print(f"errors:       {report['errors']}, ignored clicks: {report['ignored_clicks']}")
+    for name, summary in report['latency_ms'].items():
+        print(f"  {name:<8} p50 {summary['p50']:8.2f} ms  p99 {summary['p99']:8.2f} ms  n={summary['count']}")
+
+
+if __name__ == '__main__':
+    main()
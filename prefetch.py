@@ -0,0 +1,104 @@
+import collections
+import queue
+import threading
+
+# --------------------------
+# Round prefetching
+# --------------------------
+# Worker threads keep up to `depth` rounds prepared ahead of the UI. Random
+# rounds go through a bounded queue; rounds for a specific category (learning
+# mode repetitions) are requested with want() and served first.
+DEFAULT_DEPTH = 4
+DEFAULT_WORKERS = 2
+
+
+class RoundPrefetcher:
+    def __init__(self, prepare, pick_category, depth=DEFAULT_DEPTH, workers=DEFAULT_WORKERS):
+        self.prepare = prepare
+        self.pick_category = pick_category
+        self.depth = depth
+        self.ready = queue.Queue(maxsize=depth)
+        self.targeted = collections.defaultdict(collections.deque)
+        self.wanted = collections.deque()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, workers))]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock:
+            self.wanted.clear()
+            self.targeted.clear()
+        while True:
+            try:
+                self.ready.get_nowait()
+            except queue.Empty:
+                break
+
+    def want(self, category, count=1):
+        with self.lock:
+            self.wanted.extend([category] * count)
+
+    def get(self, category=None):
+        with self.lock:
+            if category is not None:
+                rounds = self.targeted.get(category)
+                if rounds:
+                    return rounds.popleft()
+                return None
+        try:
+            return self.ready.get_nowait()
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        with self.lock:
+            targeted = sum(len(rounds) for rounds in self.targeted.values())
+        return self.ready.qsize() + targeted
+
+    def _next_wanted(self):
+        with self.lock:
+            if self.wanted:
+                return self.wanted.popleft()
+        return None
+
+    def _run(self):
+        while not self.cancelled.is_set():
+            category = self._next_wanted()
+            if category is not None:
+                prepared = self._prepare(category)
+                if prepared is not None:
+                    with self.lock:
+                        if not self.cancelled.is_set():
+                            self.targeted[category].append(prepared)
+                continue
+            category = self.pick_category()
+            if category is None:
+                return
+            prepared = self._prepare(category)
+            if prepared is None:
+                self.cancelled.wait(0.5)
+            while prepared is not None and not self.cancelled.is_set():
+                try:
+                    self.ready.put(prepared, timeout=0.1)
+                    break
+                except queue.Full:
+                    # Let a learning-mode request jump ahead while the queue is full.
+                    wanted = self._next_wanted()
+                    if wanted is not None:
+                        targeted = self._prepare(wanted)
+                        if targeted is not None:
+                            with self.lock:
+                                if not self.cancelled.is_set():
+                                    self.targeted[wanted].append(targeted)
+
+    def _prepare(self, category):
+        try:
+            return self.prepare(category)
+        except Exception:
+            return None
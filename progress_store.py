@@ -0,0 +1,480 @@
+import argparse
+import json
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+
+# --------------------------
+# Learner progress store
+# --------------------------
+# Append-only event log in SQLite (WAL mode). The game thread only enqueues;
+# one writer thread owns the connection and commits in batches. Compaction
+# rolls events older than `compact_after_days` up into per-day summaries and
+# truncates the WAL. Each learner's category scheduler state (see scheduler.py)
+# is kept alongside, one upserted row per learner, level and category.
+KINDS = ('round', 'found', 'complete', 'miss', 'reveal', 'learning')
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_COMPACT_INTERVAL = 3600.0
+DEFAULT_COMPACT_AFTER_DAYS = 180
+# How long flush() and load_schedule() wait on the writer thread before giving up.
+DEFAULT_FLUSH_TIMEOUT = 10.0
+# Lab mode runs one writer per child against a shared database, so a locked
+# database is waited on, then retried with backoff; the writer only gives up
+# (and flush() raises) once the retries run out.
+BUSY_TIMEOUT_MS = 5000
+WRITE_RETRIES = 5
+WRITE_BACKOFF = 0.1
+REPORT_PERCENTILES = (50, 90, 99)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS learners (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    learner_id INTEGER NOT NULL,
+    session TEXT NOT NULL,
+    ts REAL NOT NULL,
+    kind INTEGER NOT NULL,
+    category_id INTEGER,
+    level INTEGER,
+    learning INTEGER NOT NULL DEFAULT 0,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS summaries (
+    learner_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    misses INTEGER NOT NULL,
+    missed INTEGER NOT NULL,
+    rt_count INTEGER NOT NULL,
+    rt_sum REAL NOT NULL,
+    rt_sumsq REAL NOT NULL,
+    PRIMARY KEY (learner_id, category_id, level, day)
+);
+CREATE TABLE IF NOT EXISTS schedules (
+    learner_id INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    rounds INTEGER NOT NULL,
+    accuracy REAL NOT NULL,
+    response_time REAL,
+    last_round INTEGER NOT NULL,
+    PRIMARY KEY (learner_id, level, category_id)
+);
+"""
+
+# Scored (non-learning) events only, matching how GameEngine keeps score.
+COMPACT_SQL = """
+INSERT INTO summaries
+SELECT learner_id, category_id, level, CAST(ts / 86400 AS INTEGER) AS day,
+       SUM(kind = :round), SUM(kind = :complete), SUM(kind = :miss),
+       SUM(CASE WHEN kind = :reveal THEN value ELSE 0 END),
+       SUM(kind = :complete), SUM(CASE WHEN kind = :complete THEN value ELSE 0 END),
+       SUM(CASE WHEN kind = :complete THEN value * value ELSE 0 END)
+FROM events
+WHERE ts < :cutoff AND learning = 0 AND category_id IS NOT NULL
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (learner_id, category_id, level, day) DO UPDATE SET
+    rounds = rounds + excluded.rounds,
+    completed = completed + excluded.completed,
+    misses = misses + excluded.misses,
+    missed = missed + excluded.missed,
+    rt_count = rt_count + excluded.rt_count,
+    rt_sum = rt_sum + excluded.rt_sum,
+    rt_sumsq = rt_sumsq + excluded.rt_sumsq
+"""
+
+
+class _Control:
+    def __init__(self, action):
+        self.action = action
+        self.done = threading.Event()
+
+
+class _Schedule:
+    def __init__(self, learner, level, category, row):
+        self.learner = learner
+        self.level = level
+        self.category = category
+        self.row = row
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class ProgressStore:
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 compact_interval=DEFAULT_COMPACT_INTERVAL, compact_after_days=DEFAULT_COMPACT_AFTER_DAYS):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.compact_after_days = compact_after_days
+        self.pending = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.ready = threading.Event()
+        self.error = None
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def log(self, learner, session, level, event):
+        self.pending.put((learner, session, level, event))
+
+    def recorder(self, learner, level, session=None):
+        # Returns an on_event callback for GameEngine bound to one learner and session.
+        session = session or uuid.uuid4().hex
+        return lambda event: self.log(learner, session, level, event)
+
+    def save_schedule(self, learner, level, category, row):
+        # row: (rounds, accuracy, response_time, last_round); written with the next batch.
+        self.pending.put(_Schedule(learner, level, category, row))
+
+    def schedule_saver(self, learner, level):
+        # Returns an on_update callback for CategoryScheduler.
+        return lambda category, row: self.save_schedule(learner, level, category, row)
+
+    def load_schedule(self, learner, level, timeout=DEFAULT_FLUSH_TIMEOUT):
+        self.flush(timeout)
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT c.name, s.rounds, s.accuracy, s.response_time, s.last_round FROM schedules s"
+                " JOIN learners l ON l.id = s.learner_id JOIN categories c ON c.id = s.category_id"
+                " WHERE l.name = ? AND s.level = ?", (learner, level)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {name: tuple(row) for name, *row in rows}
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        self._control('flush', timeout)
+
+    def compact(self, timeout=None):
+        self._control('compact', timeout)
+
+    def _control(self, action, timeout):
+        # Re-raises whatever stopped the writer thread instead of waiting on it forever.
+        control = _Control(action)
+        if self.error is None:
+            self.pending.put(control)
+            control.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        if not control.done.is_set():
+            raise TimeoutError(f"Progress store writer did not {action} within {timeout:.1f}s")
+
+    def close(self):
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+
+    # --- writer thread ---
+
+    def _id(self, conn, cache, table, name):
+        row_id = cache.get(name)
+        if row_id is None:
+            conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            row_id = conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            cache[name] = row_id
+        return row_id
+
+    def _write(self, conn, batch, learners, categories):
+        rows = []
+        schedules = {}
+        for item in batch:
+            if isinstance(item, _Schedule):
+                # Only the latest row per key matters.
+                key = (self._id(conn, learners, 'learners', item.learner), item.level,
+                       self._id(conn, categories, 'categories', item.category))
+                schedules[key] = item.row
+                continue
+            learner, session, level, event = item
+            category = event.get('category')
+            rows.append((
+                self._id(conn, learners, 'learners', learner), session, event['ts'], KIND_CODES[event['kind']],
+                self._id(conn, categories, 'categories', category) if category else None,
+                level, int(bool(event.get('learning'))), event.get('value'),
+            ))
+        with conn:
+            conn.executemany(
+                "INSERT INTO events (learner_id, session, ts, kind, category_id, level, learning, value)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO schedules"
+                " (learner_id, level, category_id, rounds, accuracy, response_time, last_round)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", [key + tuple(row) for key, row in schedules.items()]
+            )
+        self.written += len(rows)
+        self.batches += 1
+
+    def _compact(self, conn):
+        cutoff = time.time() - self.compact_after_days * 86400
+        params = dict(KIND_CODES, cutoff=cutoff)
+        with conn:
+            conn.execute(COMPACT_SQL, params)
+            conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,))
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _run(self):
+        try:
+            conn = connect(self.db_path)
+        except sqlite3.Error as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        try:
+            self._serve(conn)
+        except Exception as e:
+            self.error = e
+            # Wake anyone still waiting; they re-raise the error.
+            while True:
+                try:
+                    item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Control):
+                    item.done.set()
+        finally:
+            conn.close()
+
+    def _retry(self, conn, action, *id_caches):
+        delay = WRITE_BACKOFF
+        for attempt in range(WRITE_RETRIES):
+            try:
+                return action()
+            except sqlite3.Error:
+                # Ids cached during the rolled-back transaction may not exist.
+                conn.rollback()
+                for cache in id_caches:
+                    cache.clear()
+                if attempt == WRITE_RETRIES - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    def _serve(self, conn):
+        learners = {}
+        categories = {}
+        next_compact = time.monotonic() + self.compact_interval
+        running = True
+        while running:
+            batch = []
+            controls = []
+            try:
+                item = self.pending.get(timeout=self.flush_interval)
+                while True:
+                    if item is None:
+                        running = False
+                    elif isinstance(item, _Control):
+                        controls.append(item)
+                    else:
+                        batch.append(item)
+                    if not running or controls or len(batch) >= self.batch_size:
+                        break
+                    item = self.pending.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                if batch:
+                    self._retry(conn, lambda: self._write(conn, batch, learners, categories), learners, categories)
+                compact = any(control.action == 'compact' for control in controls)
+                if compact or time.monotonic() >= next_compact:
+                    next_compact = time.monotonic() + self.compact_interval
+                    self._retry(conn, lambda: self._compact(conn), learners, categories)
+            finally:
+                for control in controls:
+                    control.done.set()
+
+
+# --------------------------
+# Reporting
+# --------------------------
+
+def load_events(conn, since=None):
+    # Columns as NumPy arrays; only scored (non-learning) events are reported.
+    sql = "SELECT learner_id, category_id, kind, value FROM events WHERE learning = 0 AND category_id IS NOT NULL"
+    params = ()
+    if since is not None:
+        sql += " AND ts >= ?"
+        params = (since,)
+    rows = np.array(conn.execute(sql, params).fetchall(), dtype=np.float64).reshape(-1, 4)
+    return (rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64), rows[:, 2].astype(np.int64),
+            np.nan_to_num(rows[:, 3]))
+
+
+def grouped_percentiles(groups, values, num_groups, percentiles):
+    # Percentiles of `values` within each group, without a Python loop over groups:
+    # sort by (group, value), then index each group's slice at the wanted ranks.
+    result = np.full((num_groups, len(percentiles)), np.nan)
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    counts = np.bincount(groups, minlength=num_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    for j, p in enumerate(percentiles):
+        ranks = starts + np.floor((counts - 1) * p / 100).astype(np.int64)
+        result[present, j] = values[ranks[present]]
+    return result
+
+
+def build_report(conn, since=None):
+    names = dict(conn.execute("SELECT id, name FROM categories").fetchall())
+    if not names:
+        return {'learners': 0, 'categories': {}}
+    num_categories = max(names) + 1
+    learner_ids, category_ids, kinds, values = load_events(conn, since)
+    num_learners = int(learner_ids.max()) + 1 if len(learner_ids) else 0
+
+    def per_category(kind, weights=None):
+        mask = kinds == KIND_CODES[kind]
+        return np.bincount(category_ids[mask], weights=None if weights is None else weights[mask],
+                           minlength=num_categories)
+
+    rounds = per_category('round')
+    completed = per_category('complete')
+    misses = per_category('miss')
+    missed = per_category('reveal', values)
+    # Fold in compacted history.
+    if since is None:
+        summary = np.array(conn.execute(
+            "SELECT category_id, rounds, completed, misses, missed FROM summaries").fetchall(),
+            dtype=np.float64).reshape(-1, 5)
+        cat = summary[:, 0].astype(np.int64)
+        rounds = rounds + np.bincount(cat, summary[:, 1], num_categories)
+        completed = completed + np.bincount(cat, summary[:, 2], num_categories)
+        misses = misses + np.bincount(cat, summary[:, 3], num_categories)
+        missed = missed + np.bincount(cat, summary[:, 4], num_categories)
+    attempts = completed + misses + missed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        accuracy = np.where(attempts > 0, completed / attempts, np.nan)
+
+    complete = kinds == KIND_CODES['complete']
+    latency = grouped_percentiles(category_ids[complete], values[complete], num_categories, REPORT_PERCENTILES)
+
+    # Per-learner accuracy within each category, then its spread across learners.
+    scored = np.isin(kinds, [KIND_CODES['complete'], KIND_CODES['miss'], KIND_CODES['reveal']])
+    pair = category_ids[scored] * max(num_learners, 1) + learner_ids[scored]
+    pair_weights = np.where(kinds[scored] == KIND_CODES['reveal'], values[scored], 1.0)
+    pair_attempts = np.bincount(pair, weights=pair_weights)
+    pair_correct = np.bincount(pair, weights=(kinds[scored] == KIND_CODES['complete']).astype(np.float64),
+                               minlength=len(pair_attempts))
+    seen = np.nonzero(pair_attempts)[0]
+    learner_accuracy = pair_correct[seen] / pair_attempts[seen]
+    learner_spread = grouped_percentiles(seen // max(num_learners, 1), learner_accuracy, num_categories, (25, 50, 75))
+    learners_per_category = np.bincount(seen // max(num_learners, 1), minlength=num_categories)
+
+    categories = {}
+    for cat_id, name in sorted(names.items(), key=lambda item: item[1]):
+        if not rounds[cat_id] and not attempts[cat_id]:
+            continue
+        categories[name] = {
+            'rounds': int(rounds[cat_id]),
+            'completed': int(completed[cat_id]),
+            'misses': int(misses[cat_id]),
+            'missed_instances': int(missed[cat_id]),
+            'accuracy': None if np.isnan(accuracy[cat_id]) else float(accuracy[cat_id]),
+            'learners': int(learners_per_category[cat_id]),
+            'response_time_s': {f"p{p}": None if np.isnan(v) else float(v)
+                                for p, v in zip(REPORT_PERCENTILES, latency[cat_id])},
+            'learner_accuracy': {f"p{p}": None if np.isnan(v) else float(v)
+                                 for p, v in zip((25, 50, 75), learner_spread[cat_id])},
+        }
+    return {'learners': len(np.unique(learner_ids)), 'events': int(len(kinds)), 'categories': categories}
+
+
+def simulate(db_path, learners, sessions, rounds, seed=0):
+    # Synthetic history for trying the report at classroom scale.
+    rng = random.Random(seed)
+    names = ['cat', 'dog', 'person', 'car', 'bus', 'chair', 'bird', 'horse', 'cup', 'bottle']
+    store = ProgressStore(db_path, batch_size=4096).start()
+    now = time.time()
+    for learner in range(learners):
+        skill = rng.uniform(0.4, 0.95)
+        for _ in range(sessions):
+            record = store.recorder(f"learner{learner:05d}", rng.randint(1, 3))
+            ts = now - rng.uniform(0, 30 * 86400)
+            for _ in range(rounds):
+                category = rng.choice(names)
+                record({'kind': 'round', 'ts': ts, 'category': category, 'learning': False, 'value': 1})
+                while rng.random() > skill:
+                    record({'kind': 'miss', 'ts': ts, 'category': category, 'learning': False, 'value': None})
+                record({'kind': 'complete', 'ts': ts, 'category': category, 'learning': False,
+                        'value': rng.lognormvariate(1.0, 0.5)})
+                ts += 10
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learner progress log: reporting and maintenance.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    report = sub.add_parser('report', help="Per-category accuracy and response-time distributions")
+    report.add_argument('db')
+    report.add_argument('--since-days', type=float)
+    report.add_argument('--json', action='store_true')
+    compact = sub.add_parser('compact', help="Roll old events into daily summaries")
+    compact.add_argument('db')
+    compact.add_argument('--older-than-days', type=float, default=DEFAULT_COMPACT_AFTER_DAYS)
+    sim = sub.add_parser('simulate', help="Fill a database with synthetic learners")
+    sim.add_argument('db')
+    sim.add_argument('--learners', type=int, default=1000)
+    sim.add_argument('--sessions', type=int, default=5)
+    sim.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'simulate':
+        simulate(args.db, args.learners, args.sessions, args.rounds)
+        return
+    if args.command == 'compact':
+        store = ProgressStore(args.db, compact_after_days=args.older_than_days).start()
+        store.compact()
+        store.close()
+        return
+    conn = connect(args.db)
+    since = time.time() - args.since_days * 86400 if args.since_days is not None else None
+    started = time.perf_counter()
+    result = build_report(conn, since)
+    result['report_s'] = time.perf_counter() - started
+    conn.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['learners']} learners, {result.get('events', 0)} events ({result['report_s']:.2f} s)")
+    print(f"{'category':<16}{'rounds':>8}{'acc':>7}{'rt p50':>8}{'rt p90':>8}{'rt p99':>8}{'learners':>10}{'acc p25-p75':>14}")
+    for name, c in result['categories'].items():
+        rt = c['response_time_s']
+        spread = c['learner_accuracy']
+        fmt = lambda v, spec: format(v, spec) if v is not None else '-'
+        print(f"{name:<16}{c['rounds']:>8}{fmt(c['accuracy'], '>7.0%')}"
+              f"{fmt(rt['p50'], '>7.1f')}s{fmt(rt['p90'], '>7.1f')}s{fmt(rt['p99'], '>7.1f')}s"
+              f"{c['learners']:>10}   {fmt(spread['p25'], '.0%')}-{fmt(spread['p75'], '.0%')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import threading
+
+# --------------------------
+# Round eligibility index
+# --------------------------
+# Maps (category, level, filter thresholds) -> images that pass the round filters,
+# together with their qualifying bboxes, so picking a round never opens a file
+# or touches the annotation API.
+INDEX_VERSION = 2
+
+
+def source_signature(annotation_file):
+    st = os.stat(annotation_file)
+    return {'path': os.path.abspath(annotation_file), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+def thresholds_key(max_instances, min_bbox_size, min_multi_instance_size, max_small_instances):
+    return f"{max_instances}:{min_bbox_size}:{min_multi_instance_size}:{max_small_instances}"
+
+
+def qualifying_instances(anns, cat_ids, max_instances, min_bbox_size, min_multi_instance_size, max_small_instances):
+    # Returns [(ann_id, (x1, y1, x2, y2)), ...] or None when the image fails the filters.
+    instances = []
+    small_instances_count = 0
+    for ann in anns:
+        if ann['category_id'] in cat_ids:
+            x, y, w, h = [int(v) for v in ann['bbox']]
+            if w < min_multi_instance_size or h < min_multi_instance_size:
+                small_instances_count += 1
+            if w >= min_bbox_size and h >= min_bbox_size:
+                instances.append((ann['id'], (x, y, x+w, y+h)))
+    if len(instances) > 1 and small_instances_count > max_small_instances:
+        return None
+    if len(instances) > max_instances:
+        return None
+    return instances or None
+
+
+def build_round_index(coco, max_instances, min_bbox_size, min_multi_instance_size, max_small_instances):
+    entries = {}
+    for cat in coco.loadCats(coco.getCatIds()):
+        cat_ids = [cat['id']]
+        rounds = entries.setdefault(cat['name'].lower(), [])
+        for img_id in coco.getImgIds(catIds=cat_ids):
+            anns = coco.loadAnns(coco.getAnnIds(imgIds=img_id, catIds=cat_ids, iscrowd=None))
+            instances = qualifying_instances(anns, cat_ids, max_instances, min_bbox_size,
+                                             min_multi_instance_size, max_small_instances)
+            if instances is None:
+                continue
+            img_info = coco.loadImgs(img_id)[0]
+            rounds.append([img_id, img_info['file_name'], img_info['width'], img_info['height'],
+                           [list(bbox) for _, bbox in instances], [ann_id for ann_id, _ in instances]])
+    return entries
+
+
+def _read_index_file(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_index_file(cache_path, data):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    # Lab children and round_pack workers may build the same index at once.
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+
+def load_round_index(coco, annotation_file, cache_path, max_instances, min_bbox_size,
+                     min_multi_instance_size, max_small_instances):
+    key = thresholds_key(max_instances, min_bbox_size, min_multi_instance_size, max_small_instances)
+    signature = source_signature(annotation_file)
+    data = _read_index_file(cache_path)
+    if not data or data.get('version') != INDEX_VERSION or data.get('source') != signature:
+        data = {'version': INDEX_VERSION, 'source': signature, 'levels': {}}
+    if key not in data['levels']:
+        data['levels'][key] = build_round_index(coco, max_instances, min_bbox_size,
+                                                min_multi_instance_size, max_small_instances)
+        try:
+            _write_index_file(cache_path, data)
+        except OSError:
+            pass
+    return RoundIndex(data['levels'][key])
+
+
+class RoundIndex:
+    def __init__(self, entries):
+        self.entries = entries
+        self.categories = sorted(cat for cat, rounds in entries.items() if rounds)
+
+    def __len__(self):
+        return sum(len(rounds) for rounds in self.entries.values())
+
+    def has_category(self, category):
+        return bool(self.entries.get(category))
+
+    def random_category(self):
+        if not self.categories:
+            return None
+        return random.choice(self.categories)
+
+    def exclude(self, file_names):
+        # Drops the rounds of images that cannot be read (see verify.py). Lists
+        # are replaced, not edited, so concurrent pick() calls stay safe.
+        file_names = set(file_names)
+        removed = 0
+        for category, rounds in list(self.entries.items()):
+            kept = [r for r in rounds if r[1] not in file_names]
+            if len(kept) != len(rounds):
+                removed += len(rounds) - len(kept)
+                self.entries[category] = kept
+        if removed:
+            self.categories = sorted(cat for cat, rounds in self.entries.items() if rounds)
+        return removed
+
+    def pick(self, category):
+        rounds = self.entries.get(category)
+        if not rounds:
+            return None
+        img_id, file_name, width, height, bboxes, ann_ids = random.choice(rounds)
+        return {
+            'image_id': img_id,
+            'file_name': file_name,
+            'width': width,
+            'height': height,
+            'bboxes': [tuple(b) for b in bboxes],
+            'ann_ids': list(ann_ids),
+        }
@@ -0,0 +1,268 @@
+import argparse
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import shutil
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+from annotation_store import open_annotation_store
+from game_engine import DISPLAY_SIZE, FEEDBACK_PHRASES, HIT_TEST_MODE, RoundFactory, prompt_text
+from image_source import make_image_source
+from round_index import load_round_index
+
+# --------------------------
+# Offline round packs
+# --------------------------
+# A pack holds ready-to-play rounds for one level: display-size JPEG bytes,
+# bboxes already scaled to display coordinates, a zlib-compressed label map and
+# the prompt/feedback audio. Layout follows the annotation store: magic, header
+# length, JSON header, then a 64-byte aligned data section that is mmapped.
+PACK_MAGIC = b'FIPACK01'
+PACK_VERSION = 1
+ALIGNMENT = 64
+JPEG_QUALITY = 90
+MASK_COMPRESSION = 6
+
+
+def select_rounds(round_index, categories=None, max_per_category=None, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for category in sorted(categories or round_index.categories):
+        rounds = round_index.entries.get(category) or []
+        if max_per_category and len(rounds) > max_per_category:
+            rounds = rng.sample(rounds, max_per_category)
+        for img_id, file_name, width, height, bboxes, ann_ids in rounds:
+            jobs.append((category, {
+                'image_id': img_id, 'file_name': file_name, 'width': width, 'height': height,
+                'bboxes': [tuple(b) for b in bboxes], 'ann_ids': list(ann_ids),
+            }))
+    return jobs
+
+
+# Worker processes each open their own memory-mapped store and image source.
+_worker_factory = None
+
+
+def _init_worker(annotation_file, store_path, images_dir, zip_path, display_size, hit_test_mode):
+    global _worker_factory
+    coco = open_annotation_store(annotation_file, store_path)
+    _worker_factory = RoundFactory(coco, None, make_image_source(images_dir, zip_path),
+                                   display_size=display_size, hit_test_mode=hit_test_mode)
+
+
+def _render_round(job):
+    category, entry = job
+    try:
+        rendered = _worker_factory.render(entry)
+    except Exception:
+        return category, entry['image_id'], None, None, None
+    scale_x, scale_y = rendered['scale']
+    bboxes = [[round(x1 * scale_x, 2), round(y1 * scale_y, 2), round(x2 * scale_x, 2), round(y2 * scale_y, 2)]
+              for x1, y1, x2, y2 in entry['bboxes']]
+    buf = io.BytesIO()
+    rendered['image'].convert('RGB').save(buf, 'JPEG', quality=JPEG_QUALITY)
+    label_map = rendered['label_map']
+    mask = zlib.compress(label_map.tobytes(), MASK_COMPRESSION) if label_map is not None else None
+    return category, entry['image_id'], buf.getvalue(), bboxes, mask
+
+
+def write_pack(pack_path, header, blob_path):
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data_start = -(-(len(PACK_MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    tmp_path = pack_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.seek(data_start)
+        with open(blob_path, 'rb') as blob:
+            shutil.copyfileobj(blob, f, 1024 * 1024)
+    os.replace(tmp_path, pack_path)
+
+
+def build_pack(pack_path, level, jobs, worker_args, audio=None, workers=None, display_size=DISPLAY_SIZE,
+               progress=None):
+    # worker_args: (annotation_file, store_path, images_dir, zip_path, hit_test_mode)
+    annotation_file, store_path, images_dir, zip_path, hit_test_mode = worker_args
+    os.makedirs(os.path.dirname(pack_path) or '.', exist_ok=True)
+    blob_path = pack_path + '.data.tmp'
+    rounds = []
+    failed = 0
+    offset = 0
+
+    def append(f, data):
+        nonlocal offset
+        start = offset
+        f.write(data)
+        offset += len(data)
+        return [start, len(data)]
+
+    with open(blob_path, 'wb') as f:
+        with multiprocessing.Pool(
+            workers or os.cpu_count(), _init_worker,
+            (annotation_file, store_path, images_dir, zip_path, tuple(display_size), hit_test_mode)
+        ) as pool:
+            for done, (category, image_id, jpeg, bboxes, mask) in enumerate(
+                    pool.imap_unordered(_render_round, jobs, chunksize=8), 1):
+                if jpeg is None:
+                    failed += 1
+                else:
+                    rounds.append([category, image_id, append(f, jpeg), bboxes,
+                                   append(f, mask) if mask is not None else None])
+                if progress:
+                    progress(done, len(jobs))
+        clips = {}
+        for text, data in sorted((audio or {}).items()):
+            if data:
+                clips[text] = append(f, data)
+    rounds.sort(key=lambda r: (r[0], r[1]))
+    header = {
+        'version': PACK_VERSION,
+        'level': level,
+        'display_size': list(display_size),
+        'rounds': rounds,
+        'audio': clips,
+    }
+    try:
+        write_pack(pack_path, header, blob_path)
+    finally:
+        os.remove(blob_path)
+    return {'rounds': len(rounds), 'failed': failed, 'audio_clips': len(clips), 'bytes': os.path.getsize(pack_path)}
+
+
+def read_pack_header(pack_path):
+    with open(pack_path, 'rb') as f:
+        if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+            raise ValueError(f"{pack_path} is not a round pack")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get('version') != PACK_VERSION:
+        raise ValueError(f"{pack_path} has unsupported version {header.get('version')}")
+    header['data_start'] = -(-(len(PACK_MAGIC) + 8 + header_len) // ALIGNMENT) * ALIGNMENT
+    return header
+
+
+class RoundPack:
+    # Plays rounds straight out of a pack: a drop-in for RoundFactory that needs
+    # no annotations, no image source and no network.
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        header = read_pack_header(pack_path)
+        self.level = header['level']
+        self.display_size = tuple(header['display_size'])
+        self.data_start = header['data_start']
+        self.rounds = {}
+        for category, image_id, image, bboxes, mask in header['rounds']:
+            self.rounds.setdefault(category, []).append((image_id, image, bboxes, mask))
+        self.categories = sorted(self.rounds)
+        self.clips = header['audio']
+        self._file = open(pack_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return sum(len(rounds) for rounds in self.rounds.values())
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def _bytes(self, span):
+        start = self.data_start + span[0]
+        return self._mm[start:start + span[1]]
+
+    def random_category(self):
+        if not self.categories:
+            return None
+        return random.choice(self.categories)
+
+    def has_category(self, category):
+        return category in self.rounds
+
+    def audio(self, text):
+        span = self.clips.get(text)
+        return self._bytes(span) if span else None
+
+    def prepare(self, category):
+        rounds = self.rounds.get(category)
+        if not rounds:
+            return None
+        image_id, image, bboxes, mask = random.choice(rounds)
+        pil_img = Image.open(io.BytesIO(self._bytes(image)))
+        pil_img.load()
+        label_map = None
+        if mask is not None:
+            width, height = self.display_size
+            label_map = np.frombuffer(zlib.decompress(self._bytes(mask)), dtype=np.uint8).reshape(height, width)
+        return {
+            'category': category,
+            'entry': {'image_id': image_id},
+            'image': pil_img,
+            'bboxes': [tuple(b) for b in bboxes],
+            # Bboxes are stored in display coordinates already.
+            'scale': (1.0, 1.0),
+            'label_map': label_map,
+            'audio': self.audio(prompt_text(category)),
+        }
+
+
+def main():
+    import dataset
+    from audio_cache import AudioCache, make_engines
+    parser = argparse.ArgumentParser(description="Pre-render a level's rounds into a single memory-mapped pack file.")
+    parser.add_argument('output')
+    parser.add_argument('--level', type=int, required=True)
+    parser.add_argument('--categories', help="Comma-separated category names (default: all)")
+    parser.add_argument('--max-rounds-per-category', type=int)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--annotations', default=dataset.COCO_ANNOTATION_FILE)
+    parser.add_argument('--store', default=dataset.COCO_STORE_FILE)
+    parser.add_argument('--images', default=dataset.COCO_IMAGES_DIR)
+    parser.add_argument('--images-zip', default=dataset.COCO_IMAGES_ZIP)
+    parser.add_argument('--round-index', default=dataset.ROUND_INDEX_FILE)
+    parser.add_argument('--hit-test', choices=['mask', 'bbox'], default=HIT_TEST_MODE)
+    parser.add_argument('--no-audio', action='store_true')
+    args = parser.parse_args()
+
+    coco = open_annotation_store(args.annotations, args.store)
+    round_index = load_round_index(coco, args.annotations, args.round_index, args.level,
+                                   dataset.MIN_BBOX_SIZE, dataset.MIN_MULTI_INSTANCE_SIZE, dataset.MAX_SMALL_INSTANCES)
+    categories = None
+    if args.categories:
+        categories = [name.strip().lower() for name in args.categories.split(',') if name.strip()]
+        unknown = [name for name in categories if not round_index.has_category(name)]
+        if unknown:
+            parser.error(f"no rounds for level {args.level} in: {', '.join(unknown)}")
+    jobs = select_rounds(round_index, categories, args.max_rounds_per_category, args.seed)
+    audio = {}
+    if not args.no_audio:
+        texts = FEEDBACK_PHRASES + sorted({prompt_text(category) for category, _ in jobs})
+        print(f"Synthesizing {len(texts)} clips...")
+        cache = AudioCache(dataset.AUDIO_CACHE_DIR, make_engines(dataset.AUDIO_ENGINES),
+                           dataset.AUDIO_CACHE_MAX_BYTES, dataset.AUDIO_LANG)
+        cache.prewarm(texts)
+        audio = {text: cache.lookup(text) for text in texts}
+        missing = [text for text, data in audio.items() if not data]
+        if missing:
+            print(f"Warning: no audio for {len(missing)} of {len(texts)} phrases")
+
+    def progress(done, total):
+        if done == total or done % 100 == 0:
+            print(f"Rendered {done}/{total} rounds", end='\r' if done < total else '\n')
+
+    stats = build_pack(
+        args.output, args.level, jobs,
+        (args.annotations, args.store, args.images, args.images_zip, args.hit_test),
+        audio, args.workers, DISPLAY_SIZE, progress
+    )
+    print(f"Wrote {stats['rounds']} rounds ({stats['failed']} failed) and {stats['audio_clips']} clips "
+          f"to {args.output} ({stats['bytes'] / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
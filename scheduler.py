@@ -0,0 +1,208 @@
+import argparse
+import collections
+import random
+import threading
+import time
+
+# --------------------------
+# Adaptive category scheduler
+# --------------------------
+# Picks the next category in proportion to how much the learner still needs it:
+# low accuracy and slow answers raise a category's weight, mastered ones keep a
+# small floor so they still come back now and then, and the last few picks are
+# damped so the same word is not asked twice in a row. Weights live in a
+# Fenwick tree, so a pick and an update are both O(log n) in the number of
+# categories.
+PRIOR_ACCURACY = 0.5
+ACCURACY_ALPHA = 0.3
+RESPONSE_TIME_ALPHA = 0.3
+MIN_WEIGHT = 0.05
+SLOWNESS_RANGE = (0.5, 2.0)
+DEFAULT_RESPONSE_TIME = 5.0
+COOLDOWN_ROUNDS = 3
+COOLDOWN_FACTOR = 0.1
+
+
+class FenwickTree:
+    # Prefix sums over non-negative weights with point updates.
+    def __init__(self, weights):
+        self.size = len(weights)
+        self.tree = [0.0] + list(weights)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index, delta):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        total = 0.0
+        i = self.size
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, target):
+        # Index of the first weight whose prefix sum exceeds target.
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+class CategoryScheduler:
+    # state maps category -> (rounds, accuracy, response_time, last_round), as
+    # returned by state() and persisted by ProgressStore.save_schedule.
+    # on_update(category, row) is called after every recorded round. available
+    # (e.g. RoundFactory.has_category) is asked about every pick; a category it
+    # rejects, say because verification excluded all its images, is dropped for
+    # good. choose() may be called from prefetch workers, so everything runs
+    # under one lock.
+    def __init__(self, categories, state=None, on_update=None, rng=None, available=None):
+        self.categories = list(categories)
+        self.positions = {category: i for i, category in enumerate(self.categories)}
+        self.removed = set()
+        self.on_update = on_update
+        self.available = available
+        self.rng = rng or random.Random()
+        self.lock = threading.Lock()
+        state = state or {}
+        self.stats = {category: list(state.get(category) or (0, PRIOR_ACCURACY, None, 0))
+                      for category in self.categories}
+        self.round = max((row[3] for row in self.stats.values()), default=0)
+        # The learner's own pace is the yardstick for "slow".
+        times = sorted(row[2] for row in self.stats.values() if row[2])
+        self.baseline = times[len(times) // 2] if times else DEFAULT_RESPONSE_TIME
+        self.weights = [self._weight(category) for category in self.categories]
+        self.tree = FenwickTree(self.weights)
+        self.recent = collections.deque()
+
+    def __len__(self):
+        return len(self.categories)
+
+    def _weight(self, category):
+        if self.positions[category] in self.removed:
+            return 0.0
+        rounds, accuracy, response_time, _ = self.stats[category]
+        weight = MIN_WEIGHT + (1.0 - accuracy) ** 2
+        if response_time:
+            low, high = SLOWNESS_RANGE
+            weight *= min(max(response_time / self.baseline, low), high)
+        return weight
+
+    def _set(self, i, weight):
+        self.tree.add(i, weight - self.weights[i])
+        self.weights[i] = weight
+
+    def _remove(self, i):
+        if i not in self.removed:
+            self.removed.add(i)
+            self._set(i, 0.0)
+
+    def choose(self):
+        with self.lock:
+            while True:
+                if len(self.removed) == len(self.categories):
+                    return None
+                i = self.tree.find(self.rng.random() * self.tree.total())
+                if i in self.removed:
+                    # Only reachable through rounding left in the tree.
+                    continue
+                category = self.categories[i]
+                if self.available is None or self.available(category):
+                    break
+                self._remove(i)
+            self.round += 1
+            self.recent.append(i)
+            self._set(i, self._weight(category) * COOLDOWN_FACTOR)
+            if len(self.recent) > COOLDOWN_ROUNDS:
+                j = self.recent.popleft()
+                if j not in self.recent:
+                    self._set(j, self._weight(self.categories[j]))
+            return category
+
+    def record(self, category, score, response_time=None):
+        # score is 1.0 for a clean round down to 0.0 for a revealed one.
+        with self.lock:
+            i = self.positions.get(category)
+            if i is None:
+                return
+            row = self.stats[category]
+            row[0] += 1
+            row[1] += ACCURACY_ALPHA * (score - row[1])
+            if response_time is not None:
+                row[2] = response_time if row[2] is None else row[2] + RESPONSE_TIME_ALPHA * (response_time - row[2])
+            row[3] = self.round
+            weight = self._weight(category)
+            self._set(i, weight * COOLDOWN_FACTOR if i in self.recent else weight)
+            row = tuple(row)
+        if self.on_update is not None:
+            self.on_update(category, row)
+
+    def state(self):
+        with self.lock:
+            return {category: tuple(row) for category, row in self.stats.items() if row[0]}
+
+
+def simulate(num_categories, learners, rounds, seed=0):
+    # Synthetic learners who each find some categories hard; measures pick and
+    # update cost and how much practice lands on each learner's hardest quarter.
+    from benchmark import percentile
+    rng = random.Random(seed)
+    categories = [f"category{i:04d}" for i in range(num_categories)]
+    population = []
+    for learner in range(learners):
+        skill = {category: rng.uniform(0.2, 0.98) for category in categories}
+        hardest = set(sorted(categories, key=skill.get)[:max(1, num_categories // 4)])
+        population.append((CategoryScheduler(categories, rng=random.Random(seed + learner)), skill, hardest))
+    choose_times, record_times = [], []
+    hard_picks = 0
+    for _ in range(rounds):
+        for scheduler, skill, hardest in population:
+            start = time.perf_counter()
+            category = scheduler.choose()
+            choose_times.append(time.perf_counter() - start)
+            hard_picks += category in hardest
+            misses = 0
+            while rng.random() > skill[category] and misses < 5:
+                misses += 1
+            score = 0.0 if misses >= 5 else 1.0 / (1 + misses)
+            start = time.perf_counter()
+            scheduler.record(category, score, rng.lognormvariate(1.0, 0.3) * (2 - skill[category]))
+            record_times.append(time.perf_counter() - start)
+    return {
+        'categories': num_categories,
+        'learners': learners,
+        'rounds': rounds * learners,
+        'choose_us': {'p50': 1e6 * percentile(choose_times, 50), 'p99': 1e6 * percentile(choose_times, 99)},
+        'record_us': {'p50': 1e6 * percentile(record_times, 50), 'p99': 1e6 * percentile(record_times, 99)},
+        'hardest_quarter_share': hard_picks / (rounds * learners),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate learners against the adaptive category scheduler.")
+    parser.add_argument('--categories', type=int, default=1000)
+    parser.add_argument('--learners', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=500, help="Rounds per learner")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    report = simulate(args.categories, args.learners, args.rounds, args.seed)
+    print(f"{report['learners']} learners x {report['categories']} categories, {report['rounds']} rounds")
+    print(f"  choose  p50 {report['choose_us']['p50']:6.1f} us  p99 {report['choose_us']['p99']:6.1f} us")
+    print(f"  record  p50 {report['record_us']['p50']:6.1f} us  p99 {report['record_us']['p99']:6.1f} us")
+    print(f"  share of rounds on each learner's hardest 25%: {report['hardest_quarter_share']:.0%} (uniform: 25%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+import argparse
+import asyncio
+import collections
+import io
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import dataset
+from audio_cache import AudioCache, make_engines
+from game_engine import (
+    CLICK_DEBOUNCE_MS, DISPLAY_SIZE, FEEDBACK_PHRASES, HIT_TEST_MODE, IGNORED, LEVELS, GameEngine, RoundFactory,
+    prompt_text
+)
+from latency import record, timings
+from scheduler import CategoryScheduler
+from thumbnail_cache import ThumbnailCache
+
+# --------------------------
+# Classroom round server
+# --------------------------
+# One process loads the annotations, round indexes, thumbnail cache and audio
+# cache once and serves every kid's session over a small HTTP/1.1 JSON API.
+# The event loop only parses requests and adjudicates clicks; image decode,
+# resize, label maps and TTS run on a thread pool.
+#
+#   POST   /sessions                 {"level": n}        -> {"session": id, ...}
+#   POST   /sessions/<id>/next                           -> round
+#   POST   /sessions/<id>/click      {"x": .., "y": ..}  -> feedback
+#   POST   /sessions/<id>/answers                        -> feedback
+#   GET    /sessions/<id>                                -> state and stats
+#   GET    /sessions/<id>/image.jpg                      -> current round's image
+#   DELETE /sessions/<id>
+#   GET    /audio?text=...
+#   GET    /health
+#   GET    /stats
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+SESSION_TTL_SECONDS = 30 * 60
+REAP_INTERVAL_SECONDS = 60
+RENDER_CACHE_ITEMS = 512
+JPEG_CACHE_ITEMS = 2048
+JPEG_QUALITY = 90
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+REASONS = {
+    200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class LRUCache:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        # build() runs outside the lock; two threads may build the same key, the
+        # second result simply replaces the first.
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = build()
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {'items': len(self.items), 'hits': self.hits, 'misses': self.misses}
+
+
+def encode_jpeg(img):
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=JPEG_QUALITY)
+    return buf.getvalue()
+
+
+class SharedRoundFactory(RoundFactory):
+    # Renders are shared by every session: an image picked for one kid is served
+    # to the next from memory, label map and encoded JPEG included.
+    def __init__(self, *args, renders, jpegs, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.renders = renders
+        self.jpegs = jpegs
+
+    def render(self, entry):
+        key = (entry['image_id'], tuple(entry['ann_ids']))
+        rendered = self.renders.get_or_build(key, lambda: RoundFactory.render(self, entry))
+        self.jpegs.get_or_build(entry['image_id'], lambda: encode_jpeg(rendered['image']))
+        return rendered
+
+
+class Session:
+    def __init__(self, session_id, level, engine):
+        self.id = session_id
+        self.level = level
+        self.engine = engine
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+
+def engine_state(engine):
+    return {
+        'learning_mode': engine.learning_mode,
+        'transitioning': engine.transitioning,
+        'current_word': engine.current_word,
+        'current_category': engine.current_category,
+    }
+
+
+def round_payload(info, session_id):
+    payload = {key: value for key, value in info.items() if key != 'prepared'}
+    prepared = info.get('prepared')
+    if prepared is not None:
+        payload['image_url'] = f"/sessions/{session_id}/image.jpg"
+        payload['bboxes'] = [list(bbox) for bbox in prepared['bboxes']]
+        payload['scale'] = list(prepared['scale'])
+        payload['display_size'] = list(DISPLAY_SIZE)
+    return payload
+
+
+def audio_content_type(data):
+    return 'audio/wav' if data[:4] == b'RIFF' else 'audio/mpeg'
+
+
+class RoundServer:
+    def __init__(self, workers=None, click_debounce_ms=CLICK_DEBOUNCE_MS):
+        self.pool = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4))
+        self.click_debounce_ms = click_debounce_ms
+        self.factories = {}
+        self.sessions = {}
+        self.renders = LRUCache(RENDER_CACHE_ITEMS)
+        self.jpegs = LRUCache(JPEG_CACHE_ITEMS)
+        self.audio = {}
+        self.thumbnail_cache = None
+        self.audio_cache = None
+        self.allowed_texts = set()
+        self.requests = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def load(self, progress=print):
+        # Same startup as the desktop game, done once for every client.
+        progress("Checking dataset...")
+        dataset.ensure_dataset_available()
+        progress("Loading annotations...")
+        dataset.coco = coco = dataset.load_annotations()
+        if coco is None:
+            raise RuntimeError("Could not load the COCO dataset.")
+        dataset.image_source = dataset.open_image_source()
+        try:
+            dataset.load_quarantine()
+        except OSError:
+            pass
+        try:
+            self.thumbnail_cache = ThumbnailCache(dataset.thumbnail_cache_dir(), dataset.THUMBNAIL_CACHE_MAX_BYTES)
+        except OSError:
+            self.thumbnail_cache = None
+        try:
+            self.audio_cache = AudioCache(dataset.AUDIO_CACHE_DIR, make_engines(dataset.AUDIO_ENGINES),
+                                          dataset.AUDIO_CACHE_MAX_BYTES, dataset.AUDIO_LANG)
+        except OSError:
+            self.audio_cache = None
+        for level in LEVELS:
+            progress(f"Preparing level {level}...")
+            round_index = dataset.get_round_index(level, dataset.MIN_BBOX_SIZE, dataset.MIN_MULTI_INSTANCE_SIZE,
+                                                  dataset.MAX_SMALL_INSTANCES)
+            self.factories[level] = SharedRoundFactory(
+                coco, round_index, dataset.image_source, self.thumbnail_cache,
+                display_size=DISPLAY_SIZE, hit_test_mode=HIT_TEST_MODE,
+                renders=self.renders, jpegs=self.jpegs
+            )
+        names = [cat['name'] for cat in coco.loadCats(coco.getCatIds())]
+        self.allowed_texts = set(FEEDBACK_PHRASES) | {prompt_text(name.lower()) for name in names}
+        if self.audio_cache is not None:
+            self.pool.submit(self.audio_cache.prewarm, sorted(self.allowed_texts))
+
+    # --- API ---
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, "Unknown session")
+        session.last_seen = time.monotonic()
+        return session
+
+    async def create_session(self, body):
+        try:
+            level = int(body.get('level', LEVELS[0]))
+        except (TypeError, ValueError):
+            raise HttpError(400, "level must be an integer")
+        factory = self.factories.get(level)
+        if factory is None:
+            raise HttpError(400, f"Unknown level {level}")
+        session_id = secrets.token_urlsafe(12)
+        # Sessions are anonymous, so each one adapts from scratch and keeps nothing.
+        engine = GameEngine(factory, level, click_debounce_ms=self.click_debounce_ms,
+                            scheduler=CategoryScheduler(factory.categories, available=factory.has_category))
+        self.sessions[session_id] = Session(session_id, level, engine)
+        return {'session': session_id, 'level': level, 'display_size': list(DISPLAY_SIZE)}
+
+    async def next_round(self, session):
+        async with session.lock:
+            info = await asyncio.get_running_loop().run_in_executor(self.pool, session.engine.next_round)
+            return dict(round_payload(info, session.id), state=engine_state(session.engine))
+
+    async def click(self, session, body):
+        try:
+            x, y = int(body['x']), int(body['y'])
+        except (KeyError, TypeError, ValueError):
+            raise HttpError(400, "x and y are required")
+        async with session.lock:
+            feedback = session.engine.submit_click(x, y)
+            return dict(feedback, state=engine_state(session.engine), stats=session.engine.stats())
+
+    async def answers(self, session):
+        async with session.lock:
+            feedback = session.engine.reveal_answers()
+            if feedback.get('result') == IGNORED:
+                raise HttpError(409, "No round in progress")
+            return dict(feedback, state=engine_state(session.engine), stats=session.engine.stats())
+
+    async def round_image(self, session):
+        # The JPEG cache is only a cache: the session still holds its round's
+        # image, so an evicted entry is encoded again rather than lost.
+        prepared = session.engine.round
+        if prepared is None:
+            raise HttpError(404, "No round in progress")
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, self.jpegs.get_or_build, prepared['entry']['image_id'],
+            lambda: encode_jpeg(prepared['image']))
+
+    async def audio_clip(self, text):
+        if text not in self.allowed_texts:
+            raise HttpError(404, "Unknown phrase")
+        data = self.audio.get(text)
+        if data is None:
+            if self.audio_cache is None:
+                raise HttpError(404, "Speech is not available")
+            data = await asyncio.get_running_loop().run_in_executor(self.pool, self.audio_cache.get, text)
+            if not data:
+                raise HttpError(404, "Speech is not available")
+            self.audio[text] = data
+        return data
+
+    def stats(self):
+        return {
+            'uptime_s': time.time() - self.started,
+            'sessions': len(self.sessions),
+            'requests': self.requests,
+            'errors': self.errors,
+            'renders': self.renders.stats(),
+            'jpegs': self.jpegs.stats(),
+            'audio_clips': len(self.audio),
+            'thumbnails': self.thumbnail_cache.stats() if self.thumbnail_cache is not None else None,
+            'timings': timings.snapshot(),
+        }
+
+    async def dispatch(self, method, path, query, body):
+        # Returns (route name, status, content type, payload bytes).
+        parts = [part for part in path.split('/') if part]
+        if method == 'GET' and parts == ['health']:
+            return 'health', 200, {'levels': sorted(self.factories), 'display_size': list(DISPLAY_SIZE)}
+        if method == 'GET' and parts == ['stats']:
+            return 'stats', 200, self.stats()
+        if method == 'GET' and parts == ['audio']:
+            data = await self.audio_clip(query.get('text', [''])[0])
+            return 'audio', 200, (audio_content_type(data), data)
+        if parts[:1] == ['sessions']:
+            if len(parts) == 1:
+                if method != 'POST':
+                    raise HttpError(405, "Use POST")
+                return 'create', 200, await self.create_session(body)
+            session = self._session(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if len(parts) == 2 and method == 'GET':
+                return 'session', 200, {'state': engine_state(session.engine), 'stats': session.engine.stats()}
+            if method == 'GET' and action == 'image.jpg':
+                return 'image', 200, ('image/jpeg', await self.round_image(session))
+            if len(parts) == 2 and method == 'DELETE':
+                self.sessions.pop(session.id, None)
+                return 'delete', 200, {'deleted': session.id}
+            if method == 'POST' and action == 'next':
+                return 'next', 200, await self.next_round(session)
+            if method == 'POST' and action == 'click':
+                return 'click', 200, await self.click(session, body)
+            if method == 'POST' and action == 'answers':
+                return 'answers', 200, await self.answers(session)
+        raise HttpError(404, "Not found")
+
+    # --- HTTP ---
+
+    async def read_request(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HttpError(400, "Truncated request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Headers too large")
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "Bad Content-Length")
+        if length < 0:
+            raise HttpError(400, "Bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Body too large")
+        raw_body = await reader.readexactly(length) if length else b''
+        url = urllib.parse.urlsplit(target)
+        keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+        return method.upper(), url.path, urllib.parse.parse_qs(url.query), raw_body, keep_alive
+
+    def write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, tuple):
+            content_type, data = payload
+        else:
+            content_type, data = 'application/json', json.dumps(payload).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Access-Control-Allow-Methods: GET, POST, DELETE, OPTIONS\r\n"
+            "Access-Control-Allow-Headers: Content-Type\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + data)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, query, raw_body, keep_alive = request
+                    start = time.perf_counter()
+                    self.requests += 1
+                    if method == 'OPTIONS':
+                        route, status, payload = 'options', 204, ('text/plain', b'')
+                    else:
+                        try:
+                            body = json.loads(raw_body) if raw_body else {}
+                        except ValueError:
+                            raise HttpError(400, "Body must be JSON")
+                        if not isinstance(body, dict):
+                            raise HttpError(400, "Body must be a JSON object")
+                        route, status, payload = await self.dispatch(method, path, query, body)
+                    record(f"http.{route}", time.perf_counter() - start)
+                except HttpError as e:
+                    self.errors += 1
+                    status, payload = e.status, {'error': e.message}
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                except Exception as e:
+                    self.errors += 1
+                    status, payload = 500, {'error': str(e)}
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def reap_sessions(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL_SECONDS)
+            cutoff = time.monotonic() - SESSION_TTL_SECONDS
+            for session_id in [s.id for s in self.sessions.values() if s.last_seen < cutoff]:
+                self.sessions.pop(session_id, None)
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES,
+                                            backlog=1024)
+        reaper = asyncio.create_task(self.reap_sessions())
+        print(f"Serving rounds on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Find Items rounds to many clients from one set of caches.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, help="Thread pool size for decode, resize and TTS")
+    parser.add_argument('--click-debounce-ms', type=int, default=CLICK_DEBOUNCE_MS)
+    args = parser.parse_args()
+    server = RoundServer(args.workers, args.click_debounce_ms)
+    server.load()
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import collections
+import os
+import threading
+import time
+from PIL import Image
+from latency import span
+
+# --------------------------
+# Display-size thumbnail cache
+# --------------------------
+# Resized renditions are stored on disk as <image_id>_<w>x<h>_<resample>.jpg and
+# evicted least-recently-used first once the directory grows past max_bytes.
+# File mtimes carry the recency order across runs.
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+THUMBNAIL_QUALITY = 92
+
+
+def decode_thumbnail(img, size, resample=Image.Resampling.LANCZOS):
+    # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale while
+    # keeping both sides >= the requested size, so the final resize is cheaper.
+    with span('image.decode'):
+        img.draft(img.mode, size)
+        img.load()
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+    with span('image.resize'):
+        return img.resize(size, resample)
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decode_seconds = 0.0
+        os.makedirs(cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(cache_dir):
+            if not name.endswith('.jpg'):
+                continue
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def _name(self, image_id, size, resample):
+        return f"{image_id}_{size[0]}x{size[1]}_{Image.Resampling(resample).name.lower()}.jpg"
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'decode_seconds': self.decode_seconds,
+                'avg_decode_ms': 1000 * self.decode_seconds / self.misses if self.misses else 0.0,
+            }
+
+    def get(self, image_id, load, size, resample=Image.Resampling.LANCZOS):
+        name = self._name(image_id, size, resample)
+        path = os.path.join(self.cache_dir, name)
+        with self.lock:
+            cached = name in self.entries
+            if cached:
+                self.entries.move_to_end(name)
+        if cached:
+            try:
+                with span('thumbnail.read'):
+                    img = Image.open(path)
+                    img.load()
+                os.utime(path)
+                with self.lock:
+                    self.hits += 1
+                return img
+            except OSError:
+                with self.lock:
+                    self.total_bytes -= self.entries.pop(name, 0)
+        start = time.perf_counter()
+        img = decode_thumbnail(load(), size, resample)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.misses += 1
+            self.decode_seconds += elapsed
+        self._store(name, path, img)
+        return img
+
+    def _store(self, name, path, img):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp_path, 'JPEG', quality=THUMBNAIL_QUALITY)
+            os.replace(tmp_path, path)
+            nbytes = os.path.getsize(path)
+        except OSError:
+            return
+        evicted = []
+        with self.lock:
+            self.total_bytes += nbytes - self.entries.pop(name, 0)
+            self.entries[name] = nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_name, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                self.evictions += 1
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_name))
+            except OSError:
+                pass
@@ -0,0 +1,195 @@
+import argparse
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from PIL import Image
+from image_source import make_image_source
+
+# --------------------------
+# Image verification manifest
+# --------------------------
+# Every image is read and fully decoded in a process pool. The manifest records
+# file name -> [size, change stamp, sha1, status, width, height, error] so that
+# later runs only re-check files whose size or stamp changed; files that are no
+# longer there are kept as 'missing'. Anything not 'ok' is quarantined: the
+# game drops its rounds instead of failing on it at play time.
+MANIFEST_VERSION = 1
+OK = 'ok'
+CORRUPT = 'corrupt'
+UNREADABLE = 'unreadable'
+MISSING = 'missing'
+SAVE_INTERVAL = 30.0
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+
+def save_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+
+
+def quarantined(manifest):
+    return {name for name, row in manifest['files'].items() if row[3] != OK}
+
+
+def manifest_digest(manifest):
+    # Changes when any image's content or status does, not when it is merely touched.
+    digest = hashlib.sha1()
+    for name in sorted(manifest['files']):
+        row = manifest['files'][name]
+        digest.update(f"{name}\0{row[2]}\0{row[3]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Worker processes each open their own image source.
+_worker_source = None
+
+
+def _init_worker(open_source):
+    global _worker_source
+    _worker_source = open_source()
+
+
+def _check(name):
+    try:
+        data = _worker_source.read_bytes(name)
+    except Exception as exc:
+        return name, None, UNREADABLE, None, None, str(exc)
+    sha1 = hashlib.sha1(data).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            width, height = img.size
+    except Exception as exc:
+        return name, sha1, CORRUPT, None, None, str(exc)
+    return name, sha1, OK, width, height, None
+
+
+def verify_images(manifest_path, open_source, workers=None, full=False, on_bad=None, progress=None, stop=None,
+                  context=None):
+    # open_source must be picklable (a module-level function or a partial); it
+    # is called once here to list the files and once in every worker.
+    source = open_source()
+    if source is None:
+        raise FileNotFoundError("No image source to verify")
+    try:
+        current = source.files()
+    finally:
+        source.close()
+    manifest = load_manifest(manifest_path)
+    files = manifest['files']
+    for name, row in files.items():
+        if name not in current and row[3] != MISSING:
+            files[name] = [row[0], row[1], row[2], MISSING, None, None, "file not found"]
+            if on_bad:
+                on_bad(name)
+    # A file that comes back after going missing is checked again even if unchanged.
+    todo = [name for name, (size, stamp) in current.items()
+            if full or name not in files or files[name][3] == MISSING
+            or files[name][0] != size or files[name][1] != stamp]
+    stats = {'files': len(current), 'checked': 0, 'skipped': len(current) - len(todo), 'bad': 0}
+    if todo:
+        last_save = time.monotonic()
+        mp = multiprocessing.get_context(context)
+        with mp.Pool(workers or os.cpu_count(), _init_worker, (open_source,)) as pool:
+            for name, sha1, status, width, height, error in pool.imap_unordered(_check, todo, chunksize=16):
+                size, stamp = current[name]
+                files[name] = [size, stamp, sha1, status, width, height, error]
+                stats['checked'] += 1
+                if status != OK:
+                    stats['bad'] += 1
+                    if on_bad:
+                        on_bad(name)
+                if progress:
+                    progress(stats['checked'], len(todo))
+                if stop is not None and stop.is_set():
+                    pool.terminate()
+                    break
+                # Long runs save as they go, so an interrupted run resumes.
+                if time.monotonic() - last_save > SAVE_INTERVAL:
+                    save_manifest(manifest_path, manifest)
+                    last_save = time.monotonic()
+    save_manifest(manifest_path, manifest)
+    stats['quarantined'] = len(quarantined(manifest))
+    return stats
+
+
+class BackgroundVerifier:
+    # Runs verify_images on a daemon thread while the game is being played;
+    # on_bad is called from that thread for each newly quarantined image.
+    # Workers are spawned, not forked, as the game already runs Tk and audio threads.
+    def __init__(self, manifest_path, open_source, workers, on_bad=None):
+        self.manifest_path = manifest_path
+        self.open_source = open_source
+        self.workers = workers
+        self.on_bad = on_bad
+        self.stats = None
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.stats = verify_images(self.manifest_path, self.open_source, self.workers,
+                                       on_bad=self.on_bad, stop=self._stop, context='spawn')
+        except Exception as exc:
+            self.error = exc
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    import dataset
+    parser = argparse.ArgumentParser(description="Decode every image once and record the results in a manifest "
+                                                 "the game uses to skip broken files.")
+    parser.add_argument('--images', help="Images directory (default: the game's dataset)")
+    parser.add_argument('--images-zip', help="Images zip (default: the game's dataset)")
+    parser.add_argument('--manifest', default=dataset.image_manifest_file())
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--full', action='store_true', help="Re-check every file, not only changed ones")
+    parser.add_argument('--list', action='store_true', help="Print the quarantined files")
+    args = parser.parse_args()
+    if args.images or args.images_zip:
+        open_source = functools.partial(make_image_source, args.images or '', args.images_zip or '')
+    else:
+        open_source = dataset.open_image_source
+
+    def progress(done, total):
+        if done == total or done % 500 == 0:
+            print(f"Verified {done}/{total} images", end='\r' if done < total else '\n')
+
+    started = time.perf_counter()
+    stats = verify_images(args.manifest, open_source, args.workers, args.full, progress=progress)
+    print(f"{stats['files']} files: {stats['checked']} checked, {stats['skipped']} unchanged, "
+          f"{stats['bad']} newly bad, {stats['quarantined']} quarantined ({time.perf_counter() - started:.1f} s)")
+    if args.list:
+        manifest = load_manifest(args.manifest)
+        for name in sorted(quarantined(manifest)):
+            row = manifest['files'][name]
+            print(f"  {name}: {row[3]} ({row[6]})")
+
+
+if __name__ == '__main__':
+    main()